@@ -1,39 +1,108 @@
+import csv
+import io
+import json
+import logging
 import os
+import sys
+import time
 
-from cs50 import SQL
-from flask import Flask, flash, redirect, render_template, request, session
-from flask_session import Session
-from tempfile import mkdtemp
+import click
+from flask import (Flask, Response, before_render_template, flash, g, jsonify, redirect, render_template, request,
+                   session, stream_with_context, template_rendered)
 from werkzeug.exceptions import default_exceptions, HTTPException, InternalServerError
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from helpers import apology, login_required, lookup, usd
+import metrics
+from database import Database
+from equity import equity_curve
+from helpers import (INSTANCE_DIR, QUOTE_TTL, apology, login_required, lookup, lookup_many, quote_cache_stats,
+                     singleflight_stats, symbol_directory, usd)
+from holdings import check_holdings, rebuild_holdings
+from lots import lot_report, lots_cache
+from orders import OrderError, execute_order, place_orders
+from profiler import RequestProfiler
+from quote_refresher import QuoteRefresher
+from sessions import SQLiteSessionInterface
 
 from datetime import datetime, timezone # time_now() function is removed as per fixes
 
 from stock_dash import init_dash_app
+# Leveled logging instead of prints; LOG_LEVEL=DEBUG shows per-lookup details
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 # Configure application
 app = Flask(__name__)
-dash_app_instance = init_dash_app(app)
+# The portfolio value chart reads db, which is only opened further down; it is looked up when the chart is drawn
+dash_app_instance = init_dash_app(app, portfolio_value=lambda user_id: equity_curve(db, user_id))
 # Ensure templates are auto-reloaded
 app.config["TEMPLATES_AUTO_RELOAD"] = True
 
 # Custom filter
 app.jinja_env.filters["usd"] = usd
-# Configure session to use filesystem (instead of signed cookies)
-app.config["SESSION_FILE_DIR"] = mkdtemp()
+
+# Configure SQLite database: WAL mode, per-thread connections with cached prepared statements
+# (DATABASE_URL lets benchmarks point at a seeded copy)
+db = Database(os.environ.get("DATABASE_URL", "sqlite:///finance.db"))
+
+# Configure session to use the database (instead of signed cookies), shared by every worker process.
+# Sessions expire after SESSION_LIFETIME idle seconds; expired rows are purged every SESSION_CLEANUP_INTERVAL.
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+app.session_interface = SQLiteSessionInterface(
+    db,
+    lifetime=int(os.environ.get("SESSION_LIFETIME", 24 * 60 * 60)),
+    refresh=int(os.environ.get("SESSION_REFRESH", 5 * 60)),
+    cleanup_interval=int(os.environ.get("SESSION_CLEANUP_INTERVAL", 60 * 60)),
+)
+
+# Opt-in request profiling, off by default: PROFILE_SAMPLE_RATE profiles that fraction of requests and
+# PROFILE_TOKEN profiles any request sent with "X-Profile: <token>". PROFILE_MODE is cprofile (.pstats files)
+# or sample (collapsed stacks for flame graphs); profiles faster than PROFILE_MIN_MS are discarded.
+RequestProfiler(
+    os.environ.get("PROFILE_DIR", os.path.join(INSTANCE_DIR, "profiles")),
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    token=os.environ.get("PROFILE_TOKEN") or None,
+    mode=os.environ.get("PROFILE_MODE", "cprofile"),
+    interval=float(os.environ.get("PROFILE_INTERVAL", 0.005)),
+    min_duration=float(os.environ.get("PROFILE_MIN_MS", 0)) / 1000,
+).init_app(app)
+
+
+@app.teardown_request
+def rollback_open_transaction(exception):
+    """Never leave a transaction (and SQLite's write lock) open after a request that failed midway."""
+    db.rollback()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
 
-# Configure CS50 Library to use SQLite database
-db = SQL("sqlite:///finance.db")
+@app.after_request
+def record_request_time(response):
+    """Add the request's duration to the per-route histogram served at /metrics."""
+    if "request_started" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.request_seconds.observe((route, request.method, str(response.status_code)),
+                                        time.perf_counter() - g.request_started)
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    if "template_started" in g:
+        metrics.operation_seconds.observe(("template", template.name), time.perf_counter() - g.template_started)
 
 # Create new table, and index (for efficient search later on) to keep track of stock orders, by each user
 db.execute("CREATE TABLE IF NOT EXISTS users(id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, username TEXT NOT NULL, hash TEXT NOT NULL, cash NUMERIC NOT NULL DEFAULT 10000.00);")
 
-# NOTE: The 'portfolio' table is created but not used in the current Python logic.
-# Consider implementing logic to update it or removing this table creation if not needed.
+# Materialized holdings per user and symbol, kept in step with history by the order path (see orders.py)
 db.execute("CREATE TABLE IF NOT EXISTS portfolio ( id INTEGER PRIMARY KEY AUTOINCREMENT,user_id INTEGER NOT NULL, \
         symbol TEXT NOT NULL,shares INTEGER NOT NULL, FOREIGN KEY (user_id) REFERENCES users (id));"
         )
@@ -44,34 +113,99 @@ db.execute("CREATE TABLE IF NOT EXISTS history ( id INTEGER PRIMARY KEY AUTOINCR
         transacted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users (id));"
         )
 
+# Schema migrations, applied in order at startup; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    # 1: index the per-user lookups so they stop scanning whole tables. Duplicate portfolio rows are
+    # merged first so (user_id, symbol) can be unique, which the buy path's UPSERT relies on.
+    [
+        "UPDATE portfolio SET shares = (SELECT SUM(p.shares) FROM portfolio p \
+            WHERE p.user_id = portfolio.user_id AND p.symbol = portfolio.symbol) \
+            WHERE id IN (SELECT MIN(id) FROM portfolio GROUP BY user_id, symbol HAVING COUNT(*) > 1)",
+        "DELETE FROM portfolio WHERE id NOT IN (SELECT MIN(id) FROM portfolio GROUP BY user_id, symbol)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS portfolio_user_symbol ON portfolio (user_id, symbol)",
+        "CREATE INDEX IF NOT EXISTS history_user_transacted ON history (user_id, transacted_at)",
+        "CREATE INDEX IF NOT EXISTS users_username ON users (username)",
+    ],
+    # 2: server-side sessions shared by every worker process
+    [
+        "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY NOT NULL, data TEXT NOT NULL, \
+            expires_at REAL NOT NULL) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)",
+    ],
+    # 3: cost basis and realized P&L per holding, backfilled by replaying history (callables get the database)
+    [
+        "ALTER TABLE portfolio ADD COLUMN cost_basis REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE portfolio ADD COLUMN realized_pnl REAL NOT NULL DEFAULT 0",
+        rebuild_holdings,
+    ],
+]
+
+
+def migrate():
+    """Apply pending MIGRATIONS, each in its own transaction (safe when several workers boot at once)."""
+    for version, statements in enumerate(MIGRATIONS, start=1):
+        if db.execute("SELECT user_version FROM pragma_user_version")[0]["user_version"] >= version:
+            continue
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock in case another worker migrated first
+            if db.execute("SELECT user_version FROM pragma_user_version")[0]["user_version"] < version:
+                for statement in statements:
+                    statement(db) if callable(statement) else db.execute(statement)
+                db.execute(f"PRAGMA user_version = {version}")
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+migrate()
+
+# Transaction history is paginated by (transacted_at, id) and exported in chunks of this many rows
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 50))
+HISTORY_EXPORT_CHUNK = int(os.environ.get("HISTORY_EXPORT_CHUNK", 1000))
+SYMBOL_SEARCH_LIMIT = int(os.environ.get("SYMBOL_SEARCH_LIMIT", 10))
+# The P&L page lists this many of the most recent closed lots (the JSON report has all of them)
+PNL_CLOSED_LOTS = int(os.environ.get("PNL_CLOSED_LOTS", 100))
+
 # Make sure API key is set
 
 @app.route("/")
 @login_required
 def index():
     """Show portfolio of stocks"""
-    owns = own_shares()
+    # Shares, cost basis and realized P&L come from the materialized portfolio rows, not from history
+    rows = db.execute("SELECT symbol, shares, cost_basis, realized_pnl FROM portfolio WHERE user_id = ?",
+                      session["user_id"])
+    holdings = [row for row in rows if row["shares"] != 0]
+    realized = sum(row["realized_pnl"] for row in rows)
+    owns = {}
     total = 0
-    for symbol, shares in owns.items():
-        result = lookup(symbol)
+    # Fetch every holding's quote concurrently instead of one round trip per symbol
+    quotes = lookup_many(row["symbol"] for row in holdings)
+    for row in holdings:
+        symbol, shares, cost_basis = row["symbol"], row["shares"], row["cost_basis"]
+        result = quotes.get(symbol)
         if result: # Check if lookup was successful
             name, price = result["name"], result["price"]
             stock_value = shares * price
             total += stock_value
-            owns[symbol] = (name, shares, usd(price), usd(stock_value))
+            owns[symbol] = (name, shares, usd(cost_basis / shares), usd(price), usd(stock_value),
+                            usd(stock_value - cost_basis))
         else:
             # Handle case where lookup fails for a symbol in user's portfolio
             # This could happen if a ticker symbol becomes invalid.
             # You might want to display a message or remove the invalid symbol.
-            owns[symbol] = (f"{symbol} (Lookup Failed)", shares, usd(0), usd(0))
+            owns[symbol] = (f"{symbol} (Lookup Failed)", shares, usd(cost_basis / shares), usd(0), usd(0), "N/A")
             flash(f"Warning: Could not get current data for {symbol}.", "warning")
 
     cash = db.execute("SELECT cash FROM users WHERE id = ? ", session["user_id"])[0]['cash']
     total += cash
-    return render_template("index.html", owns=owns, cash= usd(cash), total = usd(total))
+    return render_template("index.html", owns=owns, cash= usd(cash), total = usd(total), realized=usd(realized))
 
 
 @app.route("/buy", methods=["GET", "POST"])
+@login_required
 def buy():
     """Buy shares of stock"""
     if request.method == "GET":
@@ -91,55 +225,19 @@ def buy():
 
 
     if not result:
-        # Improved error message for invalid symbol
-        not_found_msg = f"Could not find stock for '{symbol}'. Try adding an exchange suffix, e.g., 'TATAMOTORS.NS' for Indian stocks, 'D05.SI' for Singapore stocks, or 'OR.PA' for L'Oréal."
-        return apology(not_found_msg)
+        return apology(not_found_message(symbol))
 
     name = result["name"]
     price = result["price"]
     # Ensure the symbol from lookup is used for consistency, as it might be standardized
     standardized_symbol = result["symbol"]
 
-    user_id = session["user_id"]
-    cash = db.execute("SELECT cash FROM users WHERE id = ?", user_id)[0]['cash']
-
-    # Check if user can afford the purchase
-    total_cost = price * shares_to_buy
-    remain_cash = cash - total_cost
-
-    if remain_cash < 0:
-        return apology("Insufficient Cash. Failed Purchase.")
-
-    # Deduct order cost from user's remaining balance (i.e. cash)
-    db.execute("UPDATE users SET cash = ? WHERE id = ?", remain_cash, user_id)
-
-    # Log the transaction into history
-    method = "BUY"
-    db.execute("INSERT INTO history (user_id, symbol, shares, price, method) VALUES (?, ?, ?, ?, ?)", \
-                                     user_id, standardized_symbol, shares_to_buy, price, method)
-
-    # --- Start of CORRECTED portfolio update logic ---
-    # Check if user already owns this stock in their portfolio table
-    current_portfolio_shares = db.execute(
-        "SELECT shares FROM portfolio WHERE user_id = ? AND symbol = ?",
-        user_id, standardized_symbol
-    )
-
-    if current_portfolio_shares:
-        # If stock exists in portfolio, update the shares
-        existing_shares = current_portfolio_shares[0]['shares']
-        new_total_shares = existing_shares + shares_to_buy
-        db.execute(
-            "UPDATE portfolio SET shares = ? WHERE user_id = ? AND symbol = ?",
-            new_total_shares, user_id, standardized_symbol
-        )
-    else:
-        # If stock does not exist, insert a new entry
-        db.execute(
-            "INSERT INTO portfolio (user_id, symbol, shares) VALUES (?, ?, ?)",
-            user_id, standardized_symbol, shares_to_buy
-        )
-    # --- End of CORRECTED portfolio update logic ---
+    # Deduct the cost from cash (only if affordable), log the order and update the portfolio atomically
+    try:
+        fill = execute_order(db, session["user_id"], "BUY", standardized_symbol, shares_to_buy, price, name)
+    except OrderError as e:
+        return apology(str(e))
+    total_cost = fill["total"]
 
     flash(f"Bought {shares_to_buy} shares of {name} ({standardized_symbol}) for {usd(total_cost)}!")
     return redirect("/")
@@ -148,28 +246,73 @@ def buy():
 @app.route("/history")
 @login_required
 def history():
-    """Show history of transactions"""
-    # FIX: Corrected SELECT statement to use 'transacted_at'
-    rows = db.execute("SELECT symbol, shares, price, method, transacted_at FROM history WHERE user_id = ? ORDER BY transacted_at DESC", session["user_id"])
-
-    # Format prices and shares for display
-    formatted_rows = []
-    for row in rows:
-        # Shares are negative for sells, positive for buys
-        formatted_shares = row['shares']
-        # Price is per share
-        formatted_price = usd(row['price'])
-        # Calculate total value for each transaction
-        total_value = usd(abs(row['shares']) * row['price'])
-        formatted_rows.append({
-            'symbol': row['symbol'],
-            'shares': formatted_shares,
-            'price': formatted_price,
-            'total_value': total_value,
-            'method': row['method'],
-            'transacted_at': row['transacted_at']
-        })
-    return render_template("history.html", rows=formatted_rows)
+    """Show history of transactions, one page at a time (newest first)"""
+    before = None
+    if request.args.get("before") and request.args.get("before_id", "").isdigit():
+        before = (request.args["before"], int(request.args["before_id"]))
+
+    # Fetch one extra row to find out whether there is an older page
+    rows = history_rows(session["user_id"], before, HISTORY_PAGE_SIZE + 1)
+    older = None
+    if len(rows) > HISTORY_PAGE_SIZE:
+        rows = rows[:HISTORY_PAGE_SIZE]
+        older = {"before": rows[-1]["transacted_at"], "before_id": rows[-1]["id"]}
+    return render_template("history.html", rows=rows, older=older)
+
+
+@app.route("/history/export")
+@login_required
+def history_export():
+    """Stream the user's full transaction history as CSV (default) or JSON"""
+    user_id = session["user_id"]
+    as_json = request.args.get("format") == "json"
+    columns = ["symbol", "shares", "price", "method", "transacted_at"]
+
+    def chunks():
+        """Yield every history row, newest first, reading HISTORY_EXPORT_CHUNK rows per query."""
+        before = None
+        while True:
+            rows = history_rows(user_id, before, HISTORY_EXPORT_CHUNK)
+            if not rows:
+                return
+            yield rows
+            before = (rows[-1]["transacted_at"], rows[-1]["id"])
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in chunks():
+            writer.writerows([row[column] for column in columns] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_json():
+        yield "["
+        separator = ""
+        for rows in chunks():
+            yield separator + ",".join(json.dumps({column: row[column] for column in columns}) for row in rows)
+            separator = ","
+        yield "]"
+
+    if as_json:
+        return Response(stream_with_context(generate_json()), mimetype="application/json",
+                        headers={"Content-Disposition": "attachment; filename=history.json"})
+    return Response(stream_with_context(generate_csv()), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=history.csv"})
+
+
+@app.route("/pnl")
+@login_required
+def pnl():
+    """Realized and unrealized P&L per FIFO lot, as a page or (with ?format=json) as JSON"""
+    report = lot_report(db, session["user_id"])
+    if request.args.get("format") == "json":
+        return jsonify(report)
+    closed = report["closed"][::-1][:PNL_CLOSED_LOTS]
+    return render_template("pnl.html", report=report, closed=closed)
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -192,7 +335,6 @@ def login():
 
         # Query database for username
         rows = db.execute("SELECT * FROM users WHERE username = ?", request.form.get("username"))
-        print(rows)
 
         # Ensure username exists and password is correct
         if len(rows) != 1 or not check_password_hash(rows[0]["hash"], request.form.get("password")):
@@ -233,11 +375,10 @@ def quote():
         return apology("must provide symbol")
 
     result = lookup(symbol)
-    not_found_msg = f"Could not find stock for '{symbol}'. Try adding an exchange suffix, e.g., 'TATAMOTORS.NS' for Indian stocks, 'D05.SI' for Singapore stocks, or 'OR.PA' for L'Oréal."
     suggestion_message = "For better results, try adding an exchange suffix, e.g., 'TATAMOTORS.NS' for Indian stocks, 'D05.SI' for Singapore stocks."
 
     if not result:
-        return render_template("quote.html", invalid=True, symbol=symbol, message=not_found_msg)
+        return render_template("quote.html", invalid=True, symbol=symbol, message=not_found_message(symbol))
 
     return render_template("quoted.html", name=result["name"], price=usd(result["price"]), symbol=result["symbol"], message=suggestion_message)
 
@@ -268,7 +409,6 @@ def register():
     rows = db.execute("SELECT * FROM users WHERE username = ?", username)
     # Log user in, i.e. Remember that this user has logged in
     session["user_id"] = rows[0]["id"]
-    print(session["user_id"])
     # Redirect user to home page
     flash("Registered and logged in!")
     return redirect("/")
@@ -298,38 +438,103 @@ def sell():
         flash(f"You only own {owns.get(symbol, 0)} shares of {symbol}.", "warning")
         return apology("Insufficient shares owned to sell")
 
-    # Execute sell transaction: look up sell price, and add fund to cash,
+    # Execute sell transaction: look up sell price, then (atomically) reduce shares, add funds to cash and log it
     result = lookup(symbol)
     if not result:
         return apology(f"Could not get current price for {symbol}.")
-    owns_shares = owns[symbol] 
-    new_share = int(owns_shares) - int(shares_to_sell)
-    print(owns[symbol])
-    print(owns_shares)
-    print(shares_to_sell)
-    print(new_share)
-    print("DDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDDd")
-    user_id = session["user_id"]
-    current_cash = db.execute("SELECT cash FROM users WHERE id = ?", user_id)[0]['cash']
-    sell_price_per_share = result["price"]
-    total_sale_value = sell_price_per_share * shares_to_sell
-    new_cash_balance = current_cash + total_sale_value
+    try:
+        fill = execute_order(db, session["user_id"], "SELL", symbol, shares_to_sell, result["price"], result["name"])
+    except OrderError as e:
+        return apology(str(e))
 
-    db.execute("UPDATE users SET cash = ? WHERE id = ?", new_cash_balance, user_id)
+    flash(f"Sold {shares_to_sell} shares of {result['name']} ({symbol}) for {usd(fill['total'])}!")
+    return redirect("/")
 
-    # Log the transaction into history with negative shares for a sell
-    method = "SELL"
-    # FIX: Corrected INSERT statement to match history table schema and use default timestamp
-    db.execute("INSERT INTO history (user_id, symbol, shares, price, method) VALUES (?, ?, ?, ?, ?)", \
-                                     user_id, symbol, shares_to_sell, sell_price_per_share, method)
 
-    db.execute("UPDATE portfolio SET shares = ? WHERE user_id = ? AND symbol = ?", \
-                                     new_share,user_id, symbol)
+@app.route("/basket", methods=["GET", "POST"])
+@login_required
+def basket():
+    """Submit several orders at once; they are all filled in one transaction or not at all.
+    Accepts a form with one "BUY|SELL SYMBOL SHARES" order per line, or JSON
+    {"orders": [{"method": "BUY", "symbol": "AAPL", "shares": 3}, ...]} (answered with JSON)."""
+    if request.method == "GET":
+        return render_template("basket.html")
 
-    flash(f"Sold {shares_to_sell} shares of {result['name']} ({symbol}) for {usd(total_sale_value)}!")
+    try:
+        if request.is_json:
+            orders = [(str(order["method"]), str(order["symbol"]).upper().strip(), int(order["shares"]))
+                      for order in request.get_json()["orders"]]
+        else:
+            orders = []
+            for line in request.form.get("orders", "").splitlines():
+                if line.strip():
+                    method, symbol, shares = line.split()
+                    orders.append((method, symbol.upper(), int(shares)))
+    except (KeyError, TypeError, ValueError):
+        message = "each order must be: BUY|SELL SYMBOL SHARES"
+        return (jsonify(error=message), 400) if request.is_json else apology(message)
+
+    try:
+        fills = place_orders(db, session["user_id"], orders)
+    except OrderError as e:
+        return (jsonify(error=str(e)), 400) if request.is_json else apology(str(e))
+
+    if request.is_json:
+        return jsonify(fills=fills)
+    flash(f"Executed {len(fills)} orders!")
     return redirect("/")
 
 
+@app.route("/symbols")
+@login_required
+def symbols():
+    """Autocomplete: known symbols whose ticker or company name starts with ?q=, as JSON."""
+    limit = min(request.args.get("limit", SYMBOL_SEARCH_LIMIT, type=int), 50)
+    return jsonify(symbol_directory.search(request.args.get("q", ""), limit))
+
+
+@app.cli.command("import-symbols")
+@click.argument("path")
+def import_symbols(path):
+    """Merge a listing file (CSV with symbol,name or a NASDAQ Trader *listed.txt) into the symbol directory."""
+    added = symbol_directory.import_file(path)
+    click.echo(f"Added {added} symbols; the directory now has {len(symbol_directory)}.")
+
+
+@app.cli.command("rebuild-holdings")
+@click.option("--user-id", type=int, help="rebuild only this user's holdings")
+def rebuild_holdings_command(user_id):
+    """Recompute shares, cost basis and realized P&L in the portfolio table from history."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rebuilt = rebuild_holdings(db, user_id)
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    click.echo(f"Rebuilt {rebuilt} holdings from history.")
+
+
+@app.cli.command("check-holdings")
+@click.option("--user-id", type=int, help="check only this user's holdings")
+def check_holdings_command(user_id):
+    """Compare the portfolio table with a replay of history; exits with status 1 if they disagree."""
+    problems = check_holdings(db, user_id)
+    for problem in problems:
+        click.echo(json.dumps(problem))
+    if problems:
+        click.echo(f"{len(problems)} holdings disagree with history; run 'flask rebuild-holdings' to repair them.",
+                   err=True)
+        sys.exit(1)
+    click.echo("Holdings agree with history.")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Request/operation latency histograms and cache counters in the Prometheus text format."""
+    return Response(metrics.render(status_gauges()), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/dashboard", methods=["GET"])
 @login_required
 def dashboard():
@@ -350,14 +555,67 @@ for code in default_exceptions:
 def own_shares():
     """Helper function: Which stocks the user owns, and numbers of shares owned. Return: dictionary {symbol: qty}"""
     user_id = session["user_id"]
-    owns = {}
-    query = db.execute("SELECT symbol, shares FROM portfolio WHERE user_id = ?", user_id)
-    for q in query:
-        symbol, shares = q["symbol"], q["shares"]
-        owns[symbol] = owns.setdefault(symbol, 0) + shares
-    # Filter zero-share stocks
-    owns = {k: v for k, v in owns.items() if v != 0}
-    return owns
+    # Sum per symbol and filter zero-share stocks in SQL (served by the portfolio_user_symbol index)
+    query = db.execute("SELECT symbol, SUM(shares) AS shares FROM portfolio WHERE user_id = ? \
+        GROUP BY symbol HAVING SUM(shares) != 0", user_id)
+    return {q["symbol"]: q["shares"] for q in query}
+
+def history_rows(user_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Helper function: up to limit history rows for user_id, newest first.
+    before is a (transacted_at, id) keyset cursor; only rows strictly older than it are returned,
+    so every page is a range scan of the history_user_transacted index rather than an OFFSET skip.
+    """
+    if before is None:
+        return db.execute("SELECT id, symbol, shares, price, method, transacted_at FROM history \
+            WHERE user_id = ? ORDER BY transacted_at DESC, id DESC LIMIT ?", user_id, limit)
+    return db.execute("SELECT id, symbol, shares, price, method, transacted_at FROM history \
+        WHERE user_id = ? AND (transacted_at, id) < (?, ?) ORDER BY transacted_at DESC, id DESC LIMIT ?",
+        user_id, before[0], before[1], limit)
+
+def not_found_message(symbol):
+    """Helper function: why symbol was not found, suggesting known symbols that start the same way."""
+    base = symbol.upper().strip().split(".")[0]
+    matches = symbol_directory.search(base, 5) if base else []
+    if matches:
+        return f"Could not find stock for '{symbol}'. Did you mean " + ", ".join(
+            f"{match['symbol']} ({match['name']})" for match in matches) + "?"
+    return f"Could not find stock for '{symbol}'. Try adding an exchange suffix, e.g., 'TATAMOTORS.NS' for Indian stocks, 'D05.SI' for Singapore stocks, or 'OR.PA' for L'Oréal."
+
+def status_gauges():
+    """Helper function: cache, single-flight and quote refresher counters as /metrics gauges."""
+    caches = quote_cache_stats()
+    caches["lots"] = lots_cache.stats()
+    # Chart caches exist only once the dashboard has loaded the market data module
+    market_data = sys.modules.get("market_data")
+    if market_data is not None:
+        caches["bars"] = market_data.bar_cache_stats()
+        caches["recommendations"] = market_data.recommendations_cache.stats()
+    refresher = quote_refresher.stats()
+    return [
+        ("finance_cache_events", "Cache hits, misses and evictions since start.", ("cache", "event"),
+         {(name, event): stats[event] for name, stats in caches.items() for event in ("hits", "misses", "evictions")}),
+        ("finance_cache_entries", "Entries currently cached.", ("cache",),
+         {(name,): stats["size"] for name, stats in caches.items()}),
+        ("finance_singleflight_calls", "Provider calls made and callers that shared one, per group.",
+         ("group", "event"), {(name, event): stats[event] for name, stats in singleflight_stats().items()
+                              for event in ("calls", "coalesced", "inflight")}),
+        ("finance_quote_refresher_runs", "Background quote refreshes completed.", (), {(): refresher["runs"]}),
+        ("finance_quote_refresher_last_refreshed", "Quotes refreshed by the last background run.", (),
+         {(): refresher["last_refreshed"]}),
+    ]
+
+def held_symbols():
+    """Helper function: every symbol currently held by any user (the quotes worth keeping warm)."""
+    return [row["symbol"] for row in db.execute("SELECT DISTINCT symbol FROM portfolio WHERE shares != 0")]
+
+
+# Refresh the quotes of every held symbol in the background so page loads read prices from memory.
+# The interval defaults to half of QUOTE_TTL so cached quotes never expire; 0 disables the refresher.
+QUOTE_REFRESH_INTERVAL = float(os.environ.get("QUOTE_REFRESH_INTERVAL", QUOTE_TTL / 2))
+quote_refresher = QuoteRefresher(held_symbols, QUOTE_REFRESH_INTERVAL)
+if QUOTE_REFRESH_INTERVAL > 0:
+    quote_refresher.start()
 
 # The time_now() function is no longer needed if transacted_at uses DEFAULT CURRENT_TIMESTAMP
 # def time_now():
@@ -0,0 +1,188 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+from symbols import SYMBOL_PATTERN
+
+
+# Columns persisted for every series, in yfinance naming
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+
+# Only completed bars are persisted; today's partial bars always come from the provider
+STORED_INTERVALS = {"1m", "2m", "5m", "15m", "30m", "60m", "90m", "1d"}
+
+
+class BarStore:
+    """
+    On-disk columnar store of OHLCV bars, one series per (symbol, interval).
+
+    Each series lives in <root>/<SYMBOL>/<interval>/ as one memory-mapped .npy
+    file per column (int64 nanosecond timestamps plus OHLCV), together with a
+    meta.json recording the covered [start, end) date ranges. Writers build a new
+    version directory and atomically swap meta.json to point at it, so readers in
+    other processes never see a half-written series. Writers of the same series
+    take an flock on its .lock file, so two processes never merge the same old
+    version and leave one of their new versions orphaned.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def coverage(self, symbol, interval):
+        """Return the sorted, disjoint [start, end) date ranges stored for a series (empty if none)."""
+        meta = self._meta(symbol, interval)
+        if meta is None:
+            return []
+        return _ranges(meta)
+
+    def timezone(self, symbol, interval):
+        """Timezone name of a stored series' timestamps, or None if it is not stored (or naive)."""
+        meta = self._meta(symbol, interval)
+        return None if meta is None else meta["tz"]
+
+    def missing(self, symbol, interval, start, end):
+        """
+        Return the [start, end) ranges that must be fetched so the series covers start..end.
+
+        Only the uncovered parts of start..end are returned; stored ranges may have holes
+        between them, so a request never has to bridge back to an old edge of the series
+        (the provider caps how much intraday history one request may span).
+        """
+        gaps = []
+        for covered_start, covered_end in self.coverage(symbol, interval):
+            if covered_start >= end:
+                break
+            if covered_end <= start:
+                continue
+            if start < covered_start:
+                gaps.append((start, covered_start))
+            start = covered_end
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def read(self, symbol, interval, start=None, end=None):
+        """Return stored bars with start <= timestamp < end as a DataFrame, or None if nothing is stored."""
+        for _ in range(2):
+            meta = self._meta(symbol, interval)
+            if meta is None:
+                return None
+            try:
+                return self._read_version(symbol, interval, meta, start, end)
+            except FileNotFoundError:
+                # A concurrent writer replaced the version we were about to open; re-read meta.json
+                continue
+        return None
+
+    def last_close(self, symbol, interval="1d"):
+        """Return (timestamp, close) of the most recent stored bar, or None."""
+        data = self.read(symbol, interval)
+        if data is None or data.empty:
+            return None
+        return data.index[-1], float(data["Close"].iloc[-1])
+
+    def write(self, symbol, interval, data, start, end):
+        """Merge data (a yfinance-style DataFrame) into the series and extend its coverage to start..end."""
+        data = data.dropna(subset=["Close"])
+        columns = [column for column in COLUMNS if column in data.columns]
+        series_dir = self._series_dir(symbol, interval)
+        os.makedirs(series_dir, exist_ok=True)
+        with self._lock, open(os.path.join(series_dir, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            meta = self._meta(symbol, interval)
+            tz = str(data.index.tz) if data.index.tz is not None else None
+            arrays = {"ts": data.index.asi8}
+            for column in columns:
+                arrays[column] = data[column].to_numpy(dtype=np.float64)
+
+            if meta is not None:
+                old = self._load_arrays(symbol, interval, meta)
+                tz = meta["tz"]
+                columns = [column for column in columns if column in meta["columns"]]
+                # New bars first so np.unique keeps them over older copies of the same timestamp
+                arrays = {name: np.concatenate([arrays[name], old[name]]) for name in ["ts"] + columns}
+
+            _, keep = np.unique(arrays["ts"], return_index=True)
+            arrays = {name: values[keep] for name, values in arrays.items()}
+
+            version = uuid.uuid4().hex
+            version_dir = os.path.join(series_dir, version)
+            os.makedirs(version_dir, exist_ok=True)
+            for name in ["ts"] + columns:
+                np.save(os.path.join(version_dir, f"{name}.npy"), arrays[name])
+
+            ranges = _merge_ranges([[start, end]] + (_ranges(meta) if meta is not None else []))
+            new_meta = {"version": version, "start": ranges[0][0], "end": ranges[-1][1], "ranges": ranges, "tz": tz,
+                        "columns": columns}
+            meta_path = os.path.join(series_dir, "meta.json")
+            tmp_path = f"{meta_path}.{version}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(new_meta, f)
+            os.replace(tmp_path, meta_path)
+
+            # Drop the replaced version, and any a crashed writer left behind
+            for entry in os.scandir(series_dir):
+                if entry.is_dir() and entry.name != version:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _series_dir(self, symbol, interval):
+        # The symbol becomes a path component, so it must never be able to climb out of root
+        symbol = symbol.upper().strip()
+        if not SYMBOL_PATTERN.match(symbol) or interval not in STORED_INTERVALS:
+            raise ValueError(f"invalid bar series {symbol!r} ({interval!r})")
+        return os.path.join(self.root, symbol, interval)
+
+    def _meta(self, symbol, interval):
+        try:
+            with open(os.path.join(self._series_dir(symbol, interval), "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _load_arrays(self, symbol, interval, meta):
+        version_dir = os.path.join(self._series_dir(symbol, interval), meta["version"])
+        return {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r")
+                for name in ["ts"] + meta["columns"]}
+
+    def _read_version(self, symbol, interval, meta, start, end):
+        # pandas is only needed once bars are actually read; keep importing the store cheap
+        import pandas as pd
+
+        arrays = self._load_arrays(symbol, interval, meta)
+        ts = arrays["ts"]
+        lo = 0 if start is None else np.searchsorted(ts, _timestamp_ns(start, meta["tz"]), side="left")
+        hi = len(ts) if end is None else np.searchsorted(ts, _timestamp_ns(end, meta["tz"]), side="left")
+        index = pd.to_datetime(np.asarray(ts[lo:hi]), utc=meta["tz"] is not None)
+        if meta["tz"] is not None:
+            index = index.tz_convert(meta["tz"])
+        index.name = "Date" if interval == "1d" else "Datetime"
+        return pd.DataFrame({column: np.asarray(arrays[column][lo:hi]) for column in meta["columns"]}, index=index)
+
+
+def _ranges(meta):
+    """Covered [start, end) ranges of a series' meta (series written before ranges were tracked have one)."""
+    return meta.get("ranges") or [[meta["start"], meta["end"]]]
+
+
+def _merge_ranges(ranges):
+    """Sort [start, end) ranges and join those that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _timestamp_ns(day, tz):
+    """Nanosecond timestamp of midnight on day, in the series' timezone."""
+    import pandas as pd
+
+    return pd.Timestamp(str(day)[:10], tz=tz).value
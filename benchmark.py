@@ -0,0 +1,341 @@
+"""
+Benchmark and load-test the Flask routes and Dash callbacks in-process.
+
+Seeds a throwaway copy of the database with N users, M holdings and K history
+rows per user, serves market data from the deterministic synthetic provider
+and reports p50/p95/p99 latency and requests/sec per endpoint, plus
+micro-benchmarks of the indicator helpers, own_shares() and the replay of
+every user's history. Results are written as JSON so runs can be compared
+between releases:
+
+    python benchmark.py --users 50 --holdings 20 --history 1000 --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+SYMBOLS = ["AAPL", "MSFT", "GOOG", "AMZN", "META", "NVDA", "TSLA", "JPM", "V", "WMT",
+           "XOM", "JNJ", "PG", "MA", "HD", "KO", "PEP", "COST", "DIS", "NFLX",
+           "INTC", "AMD", "CSCO", "ORCL", "IBM", "BA", "CAT", "GE", "NKE", "MCD"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20, help="number of seeded users (N)")
+    parser.add_argument("--holdings", type=int, default=10, help="distinct holdings per user (M)")
+    parser.add_argument("--history", type=int, default=500, help="history rows per user (K)")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent clients per endpoint")
+    parser.add_argument("--latency", type=float, default=0.0, help="synthetic provider latency per call (seconds)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for data and market prices")
+    parser.add_argument("--only", action="append", default=[], help="run only endpoints whose name contains this")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="compare p95 latencies against a previous JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression vs baseline (fraction)")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir):
+    """Point the app at a scratch database and instance dir and use synthetic market data."""
+    database = os.path.join(workdir, "finance.db")
+    # The database layer refuses to open a database file that does not exist yet
+    open(database, "a").close()
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ["INSTANCE_DIR"] = os.path.join(workdir, "instance")
+    os.environ.setdefault("MARKET_DATA_PROVIDER", "synthetic")
+    os.environ["SYNTHETIC_SEED"] = str(args.seed)
+    os.environ["SYNTHETIC_LATENCY"] = str(args.latency)
+    # Measure the request path itself unless the caller opts into the background quote refresher
+    os.environ.setdefault("QUOTE_REFRESH_INTERVAL", "0")
+
+
+def seed_database(path, args):
+    """Insert users and history rows directly with sqlite3 for speed, then derive portfolio rows from history."""
+    from werkzeug.security import generate_password_hash
+
+    from database import Database
+    from holdings import rebuild_holdings
+
+    rng = random.Random(args.seed)
+    password_hash = generate_password_hash("benchmark")
+    con = sqlite3.connect(path)
+    with con:
+        con.executemany("INSERT INTO users (username, hash, cash) VALUES (?, ?, ?)",
+                        [(f"bench{i}", password_hash, 1_000_000) for i in range(args.users)])
+        user_ids = [row[0] for row in con.execute("SELECT id FROM users WHERE username LIKE 'bench%'")]
+
+        history = []
+        start = datetime(2020, 1, 1)
+        for user_id in user_ids:
+            symbols = rng.sample(SYMBOLS, min(args.holdings, len(SYMBOLS)))
+            # Every symbol is bought first, and sells never exceed the position, like real orders
+            position = dict.fromkeys(symbols, 0)
+            for i in range(args.history):
+                symbol = symbols[i] if i < len(symbols) else rng.choice(symbols)
+                shares = rng.randint(1, 50)
+                method = "SELL" if i >= len(symbols) and rng.random() < 0.3 else "BUY"
+                if method == "SELL":
+                    shares = min(shares, position[symbol])
+                    if not shares:
+                        continue
+                position[symbol] += -shares if method == "SELL" else shares
+                transacted_at = start + timedelta(minutes=37 * i + rng.randint(0, 30))
+                history.append((user_id, symbol, shares, method, round(rng.uniform(10, 500), 2),
+                                transacted_at.strftime("%Y-%m-%d %H:%M:%S")))
+        con.executemany("INSERT INTO history (user_id, symbol, shares, method, price, transacted_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", history)
+    con.close()
+
+    db = Database(f"sqlite:///{path}")
+    db.execute("BEGIN IMMEDIATE")
+    rebuild_holdings(db)
+    db.execute("COMMIT")
+    return user_ids
+
+
+def last_session_day():
+    """Most recent weekday before today, so intraday charts have a full session of bars."""
+    day = datetime.now().date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.isoformat()
+
+
+def dash_payload(trigger_id, state_values):
+    """Build a /_dash-update-component request body for the callback triggered by trigger_id."""
+    from dash._callback import GLOBAL_CALLBACK_LIST
+
+    for callback in GLOBAL_CALLBACK_LIST:
+        if any(item["id"] == trigger_id for item in callback["inputs"]):
+            break
+    else:
+        raise LookupError(f"no Dash callback is triggered by {trigger_id!r}")
+
+    output = callback["output"]
+    if output.startswith(".."):
+        specs = [part for part in output[2:-2].split("...")]
+    else:
+        specs = [output]
+    outputs = []
+    for spec in specs:
+        component_id, prop = spec.split(".", 1)
+        outputs.append({"id": component_id, "property": prop})
+
+    return {
+        "output": output,
+        "outputs": outputs if output.startswith("..") else outputs[0],
+        "inputs": [{"id": item["id"], "property": item["property"], "value": 1} for item in callback["inputs"]],
+        "state": [{"id": item["id"], "property": item["property"],
+                   "value": state_values.get(f"{item['id']}.{item['property']}")} for item in callback["state"]],
+        "changedPropIds": [f"{trigger_id}.n_clicks"],
+    }
+
+
+def build_endpoints(flask_app, user_ids):
+    """Return [(name, callable(client, user_id))] for every endpoint under test."""
+    rng = random.Random(1)
+    day = last_session_day()
+    dash_state = {
+        "ticker-input.value": "AAPL",
+        "single_date_picker.date": day,
+        "interval.value": "5m",
+        "date_range.start_date": "2015-01-01",
+        "date_range.end_date": day,
+        "line_choice.value": "1mo",
+        # Clicks on a loaded page, where every chart already holds a complete figure
+        "full-figures.data": {graph: True for graph in ("candle", "rsi", "bar1", "bar2", "line", "equity")},
+    }
+
+    def get(path):
+        return lambda client, user_id: client.get(path)
+
+    def post(path, data):
+        return lambda client, user_id: client.post(path, data=data() if callable(data) else data)
+
+    def dash(trigger_id):
+        payload = dash_payload(trigger_id, dash_state)
+        return lambda client, user_id: client.post("/dashboard/_dash-update-component", json=payload)
+
+    return [
+        ("GET /", get("/")),
+        ("GET /history", get("/history")),
+        ("GET /pnl", get("/pnl")),
+        ("GET /quote", get("/quote")),
+        ("POST /quote", post("/quote", lambda: {"symbol": rng.choice(SYMBOLS)})),
+        ("GET /buy", get("/buy")),
+        ("POST /buy", post("/buy", lambda: {"symbol": rng.choice(SYMBOLS), "shares": "1"})),
+        ("GET /sell", get("/sell")),
+        ("POST /sell", post("/sell", lambda: {"symbol": rng.choice(SYMBOLS), "shares": "1"})),
+        ("dash update_on_ticker_submit", dash("submit-ticker-button")),
+        ("dash update_on_candle_submit", dash("submit-candle-button")),
+        ("dash update_on_line_submit", dash("submit-line-button")),
+        ("dash update_on_portfolio_submit", dash("submit-portfolio-button")),
+    ]
+
+
+def summarise(samples, elapsed):
+    """Latency percentiles (ms) and throughput for one endpoint."""
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "rps": round(len(samples) / elapsed, 2) if elapsed else None,
+    }
+
+
+def run_endpoint(flask_app, call, user_ids, args):
+    """Time args.requests calls spread over args.concurrency logged-in clients."""
+    def worker(worker_index, count):
+        client = flask_app.test_client()
+        user_id = user_ids[worker_index % len(user_ids)]
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+        for _ in range(args.warmup):
+            call(client, user_id)
+        samples, errors = [], 0
+        window_start = time.perf_counter()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = call(client, user_id)
+            samples.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+        return samples, errors, (window_start, time.perf_counter())
+
+    per_worker = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                  for i in range(args.concurrency)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, range(args.concurrency), per_worker))
+
+    # Throughput is measured over the timed window only, excluding warm-up requests
+    elapsed = max(window[1] for _, _, window in results) - min(window[0] for _, _, window in results)
+    samples = [sample for worker_samples, _, _ in results for sample in worker_samples]
+    summary = summarise(samples, elapsed)
+    summary["errors"] = sum(errors for _, errors, _ in results)
+    return summary
+
+
+def run_micro(flask_app, own_shares, user_ids, args):
+    """Micro-benchmarks for the indicator helpers, own_shares() and the history replay."""
+    import pandas as pd
+    from flask import session
+
+    from database import Database
+    from holdings import replay_history
+    from stock_dash import calculate_ema, calculate_rsi, calculate_sma
+
+    rng = np.random.default_rng(args.seed)
+    data = pd.DataFrame({"Close": 100 * np.exp(np.cumsum(rng.normal(0, 0.001, 390 * 5)))})
+    ledger = Database(os.environ["DATABASE_URL"]).execute(
+        "SELECT user_id, symbol, shares, price, method FROM history ORDER BY transacted_at, id")
+
+    def own_shares_for_user():
+        with flask_app.test_request_context():
+            session["user_id"] = user_ids[0]
+            own_shares()
+
+    cases = [
+        ("calculate_rsi", lambda: calculate_rsi(data, window=14)),
+        ("calculate_sma", lambda: calculate_sma(data, 10)),
+        ("calculate_ema", lambda: calculate_ema(data, 10)),
+        ("own_shares", own_shares_for_user),
+        ("replay_history", lambda: replay_history(ledger)),
+    ]
+    results = {}
+    for name, fn in cases:
+        if args.only and not any(part in name for part in args.only):
+            continue
+        for _ in range(args.warmup):
+            fn()
+        samples = []
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            t = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t)
+        results[name] = summarise(samples, time.perf_counter() - started)
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Return a list of endpoints whose p95 regressed by more than tolerance."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for section in ("endpoints", "micro"):
+        for name, current in results[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if previous and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append({"name": name, "baseline_p95_ms": previous["p95_ms"],
+                                    "p95_ms": current["p95_ms"]})
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    configure_environment(args, workdir)
+
+    # Importing app creates the schema in the scratch database
+    import app as finance
+
+    user_ids = seed_database(os.path.join(workdir, "finance.db"), args)
+    flask_app = finance.app
+
+    endpoints = {}
+    for name, call in build_endpoints(flask_app, user_ids):
+        if args.only and not any(part in name for part in args.only):
+            continue
+        endpoints[name] = run_endpoint(flask_app, call, user_ids, args)
+        print(f"{name:32} p50 {endpoints[name]['p50_ms']:9.2f} ms  p95 {endpoints[name]['p95_ms']:9.2f} ms  "
+              f"p99 {endpoints[name]['p99_ms']:9.2f} ms  {endpoints[name]['rps']:9.1f} req/s", file=sys.stderr)
+
+    micro = run_micro(flask_app, finance.own_shares, user_ids, args)
+    for name, summary in micro.items():
+        print(f"{name:32} p50 {summary['p50_ms']:9.3f} ms  p95 {summary['p95_ms']:9.3f} ms", file=sys.stderr)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "provider": os.environ["MARKET_DATA_PROVIDER"],
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "endpoints": endpoints,
+        "micro": micro,
+    }
+
+    status = 0
+    if args.baseline:
+        results["regressions"] = compare(results, args.baseline, args.tolerance)
+        status = 1 if results["regressions"] else 0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+
+from metrics import timer
+
+
+# Connection tuning; see https://www.sqlite.org/pragma.html
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 16 * 1024))
+STATEMENT_CACHE_SIZE = int(os.environ.get("SQLITE_STATEMENT_CACHE_SIZE", 256))
+
+
+class Database:
+    """
+    Thin SQLite layer with the same execute() surface as cs50.SQL.
+
+    Each thread keeps its own long-lived connection (and therefore its own
+    transaction state), opened in WAL mode so readers never wait for writers.
+    sqlite3 caches each connection's prepared statements, so repeated queries
+    skip SQL parsing. execute() returns a list of dicts for statements that
+    produce rows, the new row id for an INSERT, the number of affected rows for
+    UPDATE/DELETE and True otherwise, like cs50.SQL.
+    """
+
+    def __init__(self, url):
+        self.path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+        if not os.path.exists(self.path):
+            raise RuntimeError(f"does not exist: {self.path}")
+        self._local = threading.local()
+        # journal_mode is persistent, so switching to WAL once per process is enough
+        self._connection().execute("PRAGMA journal_mode = WAL")
+
+    def execute(self, sql, *args):
+        """Execute one SQL statement with ? placeholders bound to args."""
+        command = sql.lstrip().split(None, 1)[0].upper()
+        cursor = self._connection().cursor()
+        with timer("db", command):
+            try:
+                cursor.execute(sql, args)
+            except sqlite3.IntegrityError as e:
+                # cs50.SQL reports constraint violations as ValueError
+                raise ValueError(e) from None
+
+            if cursor.description is not None:
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        if command in ("INSERT", "REPLACE"):
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+        if command in ("UPDATE", "DELETE"):
+            return cursor.rowcount
+        return True
+
+    def executemany(self, sql, rows):
+        """Execute one INSERT/UPDATE/DELETE statement once per tuple in rows; returns the number of affected rows."""
+        command = sql.lstrip().split(None, 1)[0].upper()
+        with timer("db", command):
+            try:
+                return self._connection().executemany(sql, rows).rowcount
+            except sqlite3.IntegrityError as e:
+                raise ValueError(e) from None
+
+    def in_transaction(self):
+        """Whether this thread's connection has an open transaction."""
+        connection = getattr(self._local, "connection", None)
+        return connection is not None and connection.in_transaction
+
+    def rollback(self):
+        """Roll back this thread's open transaction, if any (e.g. after an unhandled error)."""
+        if self.in_transaction():
+            self._local.connection.rollback()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000,
+                                         cached_statements=STATEMENT_CACHE_SIZE)
+            connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+            connection.execute("PRAGMA foreign_keys = ON")
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,65 @@
+"""
+Reduce chart series to roughly one point per horizontal pixel before plotting.
+
+lttb_indices() picks the visually most significant points of a line
+(largest-triangle-three-buckets); ohlc_buckets() merges consecutive candles.
+Both return the input unchanged when it is already small enough, so figure
+payloads stay bounded no matter how long the requested range is.
+"""
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the points kept by largest-triangle-three-buckets downsampling.
+
+    x must be increasing numbers (e.g. nanosecond timestamps); NaN y values are skipped.
+    The first and last points are always kept.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if threshold >= n or threshold < 3:
+        return valid
+
+    xs, ys = x[valid], y[valid]
+    # Bucket edges over the interior points (the first and last points get their own buckets)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Average of each bucket, used as the third triangle vertex for the bucket before it
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(xs[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(ys[1:n - 1], edges[:-1] - 1) / counts
+    avg_x = np.r_[avg_x[1:], xs[-1]]
+    avg_y = np.r_[avg_y[1:], ys[-1]]
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        bx, by = xs[lo:hi], ys[lo:hi]
+        # Twice the triangle area between the previously kept point, each candidate and the next bucket's average
+        area = np.abs((xs[a] - avg_x[bucket]) * (by - ys[a]) - (xs[a] - bx) * (avg_y[bucket] - ys[a]))
+        a = lo + int(area.argmax())
+        selected[bucket + 1] = a
+    selected[-1] = n - 1
+    return valid[selected]
+
+
+def ohlc_buckets(x, open_, high, low, close, max_bars):
+    """
+    Merge runs of consecutive candles so that at most max_bars remain.
+
+    Each merged candle starts at its first bar: open=first, high=max, low=min, close=last.
+    Returns (x, open, high, low, close).
+    """
+    n = len(x)
+    if n <= max_bars:
+        return x, open_, high, low, close
+    size = -(-n // max_bars)
+    starts = np.arange(0, n, size)
+    ends = np.r_[starts[1:], n] - 1
+    return (np.asarray(x)[starts], np.asarray(open_)[starts], np.maximum.reduceat(np.asarray(high), starts),
+            np.minimum.reduceat(np.asarray(low), starts), np.asarray(close)[ends])
@@ -0,0 +1,66 @@
+from helpers import lookup_many
+from metrics import timed
+
+
+@timed("report")
+def equity_curve(db, user_id):
+    """
+    Daily value of user_id's portfolio from the day of their first trade to today.
+
+    Returns a DataFrame indexed by Date with holdings, cash and total columns (empty if the
+    user has never traded). Past days are valued at their close, today at the current quote;
+    a symbol the provider has no close for is valued at its latest trade price.
+
+    Nothing loops over trades or days: positions are the cumulative sum of a days x symbols
+    matrix of net shares traded, closes for every symbol come from one get_daily_closes()
+    call, and each day's holdings value is the row-wise product of the two matrices.
+    """
+    import numpy as np
+    import pandas as pd
+    from market_data import get_daily_closes
+
+    rows = db.execute("SELECT symbol, shares, price, method, transacted_at FROM history WHERE user_id = ? \
+        ORDER BY transacted_at, id", user_id)
+    trades = pd.DataFrame.from_records(rows, columns=["symbol", "shares", "price", "method", "transacted_at"])
+    if trades.empty:
+        return pd.DataFrame(columns=["holdings", "cash", "total"], index=pd.DatetimeIndex([], name="Date"))
+    cash_now = db.execute("SELECT cash FROM users WHERE id = ?", user_id)[0]["cash"]
+
+    # Business days up to yesterday plus today; a weekend trade counts from the next day in the index.
+    # transacted_at is UTC (CURRENT_TIMESTAMP), so today is the UTC date too
+    today = pd.Timestamp.now(tz="UTC").tz_localize(None).normalize()
+    traded_on = pd.to_datetime(trades["transacted_at"]).dt.normalize().to_numpy()
+    calendar = np.arange(traded_on.min().astype("datetime64[D]"), today.to_datetime64().astype("datetime64[D]"))
+    days = pd.DatetimeIndex(np.r_[calendar[np.is_busday(calendar)], today.to_datetime64()].astype("datetime64[ns]"),
+                            name="Date")
+    # A trade stamped after today (clock skew) still lands on the last row
+    row = np.minimum(np.searchsorted(days.to_numpy(), traded_on), len(days) - 1)
+
+    codes, symbols = pd.factorize(trades["symbol"])
+    sell = (trades["method"].str.upper() == "SELL").to_numpy()
+    shares = trades["shares"].to_numpy(dtype=np.float64)
+    price = trades["price"].to_numpy(dtype=np.float64)
+    traded = np.zeros((len(days), len(symbols)))
+    np.add.at(traded, (row, codes), np.where(sell, -shares, shares))
+    positions = traded.cumsum(axis=0)
+    flows = np.bincount(row, weights=np.where(sell, shares * price, -shares * price), minlength=len(days))
+    cash = cash_now - flows.sum() + flows.cumsum()
+
+    closes = get_daily_closes(symbols, days[0].strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d"))
+    if closes.empty:
+        closes = pd.DataFrame(np.nan, index=days, columns=symbols)
+    else:
+        # Holidays and today take the previous close
+        closes = closes.reindex(columns=symbols).sort_index().reindex(days, method="ffill")
+    quotes = lookup_many(symbols[positions[-1] != 0])
+    current = pd.Series({symbol: quote["price"] for symbol, quote in quotes.items() if quote}, dtype="float64")
+    closes.iloc[-1] = current.reindex(symbols).fillna(closes.iloc[-1]).to_numpy()
+
+    fallback = np.full(traded.shape, np.nan)
+    fallback[row, codes] = price
+    fallback = pd.DataFrame(fallback).ffill().to_numpy()
+    prices = closes.to_numpy(dtype=np.float64)
+    prices = np.nan_to_num(np.where(np.isnan(prices), fallback, prices))
+
+    holdings = np.einsum("ij,ij->i", positions, prices)
+    return pd.DataFrame({"holdings": holdings, "cash": cash, "total": holdings + cash}, index=days)
@@ -1,14 +1,185 @@
 import csv
 import datetime
+import logging
+import os
 import pytz
 import requests
 import subprocess
+import threading
+import time
 import urllib
 import uuid
-import yfinance as yf
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask import redirect, render_template, session
 from functools import wraps
 
+from bar_store import BarStore
+from symbols import SYMBOL_PATTERN, SymbolDirectory
+
+log = logging.getLogger(__name__)
+
+
+# Local state (bar store, caches that survive restarts) lives under the instance directory
+INSTANCE_DIR = os.environ.get("INSTANCE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance"))
+
+# Quote cache configuration (seconds / entries); override through the environment
+QUOTE_TTL = float(os.environ.get("QUOTE_TTL", 60))
+NAME_TTL = float(os.environ.get("NAME_TTL", 7 * 24 * 60 * 60))
+QUOTE_CACHE_SIZE = int(os.environ.get("QUOTE_CACHE_SIZE", 1024))
+# Upper bound on concurrent provider requests made by lookup_many()
+LOOKUP_WORKERS = int(os.environ.get("LOOKUP_WORKERS", 16))
+# A stored daily close stands in for a missing live quote only if it is at most this many days old
+# (enough to bridge a weekend plus a holiday); older bars are whatever range was last charted
+STORED_CLOSE_MAX_AGE_DAYS = int(os.environ.get("STORED_CLOSE_MAX_AGE_DAYS", 4))
+
+# Symbols the provider had no data for are turned away without another request for this long;
+# in strict mode every symbol missing from the symbol directory is (use after importing a full listing)
+UNKNOWN_SYMBOL_TTL = float(os.environ.get("UNKNOWN_SYMBOL_TTL", 60 * 60))
+SYMBOL_DIRECTORY_STRICT = os.environ.get("SYMBOL_DIRECTORY_STRICT", "0") == "1"
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire ``ttl`` seconds after being set.
+
+    Keeps hit/miss/eviction counters so cache effectiveness can be inspected.
+    """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entries if full."""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove key from the cache and return its value."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single in-flight call.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for it and share its result (or exception).
+    """
+
+    instances = []
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        SingleFlight.instances.append(self)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) unless a call for key is already running, then wait for it."""
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn(*args, **kwargs)
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call["done"].set()
+        return call["result"]
+
+    def stats(self):
+        """Return a snapshot of the call/coalesced-waiter counters."""
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+def singleflight_stats():
+    """Return counters for every SingleFlight group, keyed by name."""
+    return {flight.name: flight.stats() for flight in SingleFlight.instances}
+
+
+# Latest prices expire quickly; company names almost never change
+quote_cache = TTLCache(QUOTE_TTL, QUOTE_CACHE_SIZE)
+name_cache = TTLCache(NAME_TTL, QUOTE_CACHE_SIZE)
+
+# Historical bars persisted across restarts and shared by every worker
+bar_store = BarStore(os.path.join(INSTANCE_DIR, "bars"))
+
+# Known symbols for autocomplete and validation; grows as the provider confirms new symbols
+symbol_directory = SymbolDirectory(os.path.join(INSTANCE_DIR, "symbols.csv"))
+unknown_symbols = TTLCache(UNKNOWN_SYMBOL_TTL, QUOTE_CACHE_SIZE)
+
+# Concurrent lookups of the same symbol share one provider request
+quote_flight = SingleFlight("quotes")
+
+# Shared pool for lookup_many(); threads are created lazily up to LOOKUP_WORKERS
+_lookup_pool = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS, thread_name_prefix="lookup")
+
 
 def apology(message, code=400):
     """Render message as an apology to user."""
@@ -41,55 +212,180 @@ def login_required(f):
 
 def lookup(symbol):
     """
-    Look up quote for a specific symbol using yfinance.
+    Look up quote for a specific symbol using the configured market data provider.
     Does not attempt fuzzy matching or suffix appending.
+    Quotes are served from quote_cache for up to QUOTE_TTL seconds, and symbols
+    that cannot exist (see may_exist) are rejected without a provider request.
     """
 
     # Normalize symbol for consistent handling
     symbol_upper = symbol.upper().strip()
 
+    cached = quote_cache.get(symbol_upper)
+    if cached is not None:
+        return dict(cached)
+    if not may_exist(symbol_upper):
+        return None
+    return _load_quote(symbol_upper)
+
+
+def lookup_many(symbols):
+    """
+    Look up quotes for several symbols at once.
+
+    Cached quotes are returned immediately and the remaining symbols are fetched
+    concurrently on a bounded thread pool, so the wait is roughly that of the
+    slowest single fetch. Returns {symbol: quote or None}, keyed by the symbols
+    as given; a failed symbol does not affect the others.
+    """
+    results = {}
+    pending = {}
+    for symbol in dict.fromkeys(symbols):
+        symbol_upper = symbol.upper().strip()
+        cached = quote_cache.get(symbol_upper)
+        if cached is not None:
+            results[symbol] = dict(cached)
+        elif not may_exist(symbol_upper):
+            results[symbol] = None
+        else:
+            pending[symbol] = symbol_upper
+
+    if len(pending) == 1:
+        symbol, symbol_upper = pending.popitem()
+        results[symbol] = _load_quote(symbol_upper)
+    elif pending:
+        futures = {symbol: _lookup_pool.submit(_load_quote, symbol_upper)
+                   for symbol, symbol_upper in pending.items()}
+        for symbol, future in futures.items():
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                log.warning("General error looking up '%s': %s", symbol, e)
+                results[symbol] = None
+    return results
+
+
+def may_exist(symbol_upper):
+    """
+    Whether symbol_upper is worth asking the provider about.
+
+    Known symbols always are. Malformed symbols, symbols the provider recently had
+    no data for and, with SYMBOL_DIRECTORY_STRICT, symbols missing from the
+    directory are not.
+    """
+    if symbol_upper in symbol_directory:
+        return True
+    if SYMBOL_DIRECTORY_STRICT or not SYMBOL_PATTERN.match(symbol_upper):
+        return False
+    return unknown_symbols.get(symbol_upper) is None
+
+
+def refresh_quotes(symbols):
+    """
+    Fetch the latest prices for symbols in one batched provider call and publish them to quote_cache.
+
+    Company names come from name_cache (fetched once per symbol). Returns the number of quotes refreshed.
+    """
+    symbols = list(dict.fromkeys(symbol.upper().strip() for symbol in symbols))
+    if not symbols:
+        return 0
+    refreshed = 0
+    for symbol, latest in _provider().latest_prices(symbols).items():
+        price = round(latest, 2)
+        if price > 0:
+            quote_cache.set(symbol, {"name": _company_name(symbol), "price": price, "symbol": symbol,
+                                     "fetched_at": time.time()})
+            refreshed += 1
+    return refreshed
+
+
+def quote_cache_stats():
+    """Return hit/miss counters for the quote and company-name caches."""
+    return {"quotes": quote_cache.stats(), "names": name_cache.stats()}
+
+
+def _load_quote(symbol_upper):
+    """Fetch a quote from the provider, coalescing concurrent fetches of the same symbol."""
+    result = quote_flight.do(symbol_upper, _fetch_and_cache_quote, symbol_upper)
+    return dict(result) if result else None
+
+
+def _fetch_and_cache_quote(symbol_upper):
+    """Fetch a quote and store it in quote_cache."""
+    result = _fetch_quote(symbol_upper)
+    if result:
+        quote_cache.set(symbol_upper, result)
+    return result
+
+
+def _provider():
+    """The configured market data provider, imported on first use so that importing helpers stays cheap and offline."""
+    from providers import provider
+    return provider
+
+
+def _company_name(symbol_upper):
+    """Return the company name for symbol_upper, asking the provider only on a name-cache miss."""
+    name = name_cache.get(symbol_upper)
+    if name is None:
+        name = _provider().company_name(symbol_upper)
+        name_cache.set(symbol_upper, name)
+    return name
+
+
+def _fetch_quote(symbol_upper):
+    """Fetch the latest price and company name for symbol_upper from the market data provider."""
     try:
-        print(f"DEBUG: Attempting direct lookup for symbol: {symbol_upper}") # Debugging print
-        ticker = yf.Ticker(symbol_upper)
+        log.debug("Attempting direct lookup for symbol: %s", symbol_upper)
 
-        # Get historical data for a short period (e.g., 1 day)
+        # Get the latest close for a short period (e.g., 1 day)
         # Use '1d' for the most recent day's data, or '5d' to ensure some data is returned
-        hist = ticker.history(period="1d", auto_adjust=True)
+        latest = _provider().latest_price(symbol_upper, period="1d")
+
+        # If no data is returned (e.g. before the open), fall back to a recent stored daily close,
+        # and only then to a slightly longer period from the provider
+        if latest is None:
+            stored = bar_store.last_close(symbol_upper, "1d")
+            if stored is not None and (datetime.date.today() - stored[0].date()).days <= STORED_CLOSE_MAX_AGE_DAYS:
+                latest = stored[1]
+            else:
+                latest = _provider().latest_price(symbol_upper, period="5d")
 
-        # If no data is returned, try a slightly longer period
-        if hist.empty:
-            hist = ticker.history(period="5d", auto_adjust=True)
-        
-        if not hist.empty:
+        if latest is not None:
             # Get the latest adjusted close price
-            price = round(float(hist["Close"].iloc[-1]), 2)
+            price = round(latest, 2)
 
-            # Get the company name (longName)
-            company_info = ticker.info
-            name = company_info.get("longName") or company_info.get("shortName") or symbol_upper
+            # Get the company name (longName), cached separately from the price
+            name = _company_name(symbol_upper)
 
             if price > 0: # Ensure we have a valid price
-                print(f"DEBUG: Found data for {symbol_upper}: {name}, ${price}")
+                log.debug("Found data for %s: %s, $%s", symbol_upper, name, price)
+                symbol_directory.add(symbol_upper, name)
                 return {
                     "name": name,
                     "price": price,
-                    "symbol": symbol_upper
+                    "symbol": symbol_upper,
+                    "fetched_at": time.time()
                 }
             else:
-                print(f"DEBUG: Price is zero or invalid for {symbol_upper}. Data might be incomplete.")
+                log.debug("Price is zero or invalid for %s. Data might be incomplete.", symbol_upper)
                 return None
         else:
-            print(f"DEBUG: No historical data found for {symbol_upper} after trying 1d and 5d periods.")
+            log.debug("No historical data found for %s after trying 1d and 5d periods.", symbol_upper)
+            # Remember the miss so retries of an unknown symbol cost no provider request
+            unknown_symbols.set(symbol_upper, True)
             return None
 
     except requests.exceptions.HTTPError as http_err:
-        print(f"Error (HTTP) during lookup for '{symbol_upper}': {http_err} - might be a subscription issue or invalid symbol.")
+        log.warning("Error (HTTP) during lookup for '%s': %s - might be a subscription issue or invalid symbol.",
+                    symbol_upper, http_err)
         return None
     except requests.exceptions.ConnectionError as conn_err:
-        print(f"Error (Connection) during lookup for '{symbol_upper}': {conn_err} - check internet connection or yfinance server.")
+        log.warning("Error (Connection) during lookup for '%s': %s - check internet connection or yfinance server.",
+                    symbol_upper, conn_err)
         return None
     except Exception as e:
-        print(f"General error looking up '{symbol_upper}': {e}")
+        log.warning("General error looking up '%s': %s", symbol_upper, e)
         return None
 
 
@@ -0,0 +1,131 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+
+COLUMNS = ("user_id", "symbol", "shares", "cost_basis", "realized_pnl")
+
+# Cost basis and realized P&L differing from a replay of history by less than this (USD) are float rounding
+TOLERANCE = 0.01
+
+
+def replay_history(rows):
+    """
+    Holdings at the end of the given history rows: a DataFrame with one row per (user_id, symbol).
+
+    rows are history rows (user_id, symbol, shares, price, method) in the order they were
+    transacted. Uses average cost accounting, like the order path: a buy adds its cost to the
+    basis, a sell removes the sold fraction of the basis and realizes the rest of its proceeds.
+
+    The ledger is replayed with grouped cumulative sums and products instead of a loop over
+    trades. Between two flat positions, the basis after trade t is A_t * sum(b_i / A_i) over the
+    trades so far, where b_i is the cost of buy i and A_t the product of the fractions of the
+    position that every sell kept. A position that history sells below zero is reported as flat.
+    """
+    import numpy as np
+    import pandas as pd
+
+    trades = pd.DataFrame.from_records(list(rows), columns=["user_id", "symbol", "shares", "price", "method"])
+    if trades.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    # Make each (user_id, symbol) contiguous, keeping the order of its trades
+    trades = trades.sort_values(["user_id", "symbol"], kind="stable", ignore_index=True)
+
+    sell = (trades["method"].str.upper() == "SELL").to_numpy()
+    shares = trades["shares"].to_numpy(dtype=np.float64)
+    price = trades["price"].to_numpy(dtype=np.float64)
+    signed = np.where(sell, -shares, shares)
+    position = pd.Series(signed).groupby([trades["user_id"], trades["symbol"]], sort=False).cumsum().to_numpy()
+    before = position - signed
+
+    # Each run of trades starting from a flat position gets its own id (a symbol's first trade always starts one)
+    opens = before <= 0
+    run = np.cumsum(opens)
+    kept = np.ones_like(shares)
+    np.divide(np.clip(position, 0, None), before, out=kept, where=sell & ~opens)
+    kept[sell & opens] = 0.0
+    bought = np.where(sell, 0.0, shares * price)
+    factor = pd.Series(kept).groupby(run).cumprod().to_numpy()
+    scaled = np.divide(bought, factor, out=np.zeros_like(bought), where=factor != 0)
+    basis = factor * pd.Series(scaled).groupby(run).cumsum().to_numpy()
+    basis_before = np.where(opens, 0.0, np.r_[0.0, basis[:-1]])
+    realized = np.where(sell, shares * price - (basis_before - basis), 0.0)
+
+    holdings = pd.DataFrame({"user_id": trades["user_id"], "symbol": trades["symbol"], "shares": position,
+                             "cost_basis": basis, "realized_pnl": realized})
+    holdings = holdings.groupby(["user_id", "symbol"], sort=False).agg(
+        shares=("shares", "last"), cost_basis=("cost_basis", "last"), realized_pnl=("realized_pnl", "sum"),
+    ).reset_index()
+    oversold = holdings["shares"] < 0
+    for row in holdings[oversold].itertuples():
+        log.warning("History of user %s sells %d more %s than it buys; treating the position as flat",
+                    row.user_id, -row.shares, row.symbol)
+    holdings.loc[oversold, ["shares", "cost_basis"]] = 0
+    holdings["shares"] = holdings["shares"].round().astype(np.int64)
+    return holdings
+
+
+def rebuild_holdings(db, user_id=None):
+    """
+    Replace the portfolio rows of user_id (of every user if None) with a replay of their history.
+
+    Returns the number of rows written. Run it inside a transaction so that orders cannot
+    interleave with the rebuild and readers never see a half-written table.
+    """
+    holdings = replay_history(_history(db, user_id))
+    if user_id is None:
+        db.execute("DELETE FROM portfolio")
+    else:
+        db.execute("DELETE FROM portfolio WHERE user_id = ?", user_id)
+    db.executemany("INSERT INTO portfolio (user_id, symbol, shares, cost_basis, realized_pnl) VALUES (?, ?, ?, ?, ?)",
+                   zip(*(holdings[column].tolist() for column in COLUMNS)))
+    return len(holdings)
+
+
+def check_holdings(db, user_id=None):
+    """
+    Portfolio rows that disagree with a replay of history, as a list of dicts (empty if consistent).
+
+    Each dict has user_id, symbol and the expected (replayed) and actual value of every column
+    that differs. Rows missing from either side count as all zeros.
+    """
+    import numpy as np
+    import pandas as pd
+
+    expected = replay_history(_history(db, user_id))
+    if user_id is None:
+        rows = db.execute("SELECT user_id, symbol, shares, cost_basis, realized_pnl FROM portfolio")
+    else:
+        rows = db.execute("SELECT user_id, symbol, shares, cost_basis, realized_pnl FROM portfolio WHERE user_id = ?",
+                          user_id)
+    actual = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    merged = expected.merge(actual, on=["user_id", "symbol"], how="outer", suffixes=("_expected", "_actual"))
+
+    differs = {}
+    for column in ("shares", "cost_basis", "realized_pnl"):
+        want = merged[f"{column}_expected"].fillna(0).to_numpy(dtype=np.float64)
+        have = merged[f"{column}_actual"].fillna(0).to_numpy(dtype=np.float64)
+        differs[column] = want != have if column == "shares" else ~np.isclose(want, have, rtol=1e-9, atol=TOLERANCE)
+
+    problems = []
+    for i in np.flatnonzero(np.logical_or.reduce(list(differs.values()))):
+        problem = {"user_id": _value(merged["user_id"].iat[i]), "symbol": merged["symbol"].iat[i]}
+        for column, mask in differs.items():
+            if mask[i]:
+                problem[column] = {"expected": _value(merged[f"{column}_expected"].iat[i]),
+                                   "actual": _value(merged[f"{column}_actual"].iat[i])}
+        problems.append(problem)
+    return problems
+
+
+def _history(db, user_id=None):
+    """History rows in the order they were transacted, ready for replay_history()."""
+    if user_id is None:
+        return db.execute("SELECT user_id, symbol, shares, price, method FROM history ORDER BY transacted_at, id")
+    return db.execute("SELECT user_id, symbol, shares, price, method FROM history WHERE user_id = ? \
+        ORDER BY transacted_at, id", user_id)
+
+
+def _value(value):
+    """A merged cell as a plain number (0 for a row missing on that side)."""
+    return 0 if value != value else value.item() if hasattr(value, "item") else value
@@ -0,0 +1,258 @@
+"""
+Vectorised technical indicators over raw NumPy arrays.
+
+Every function takes plain float arrays and returns arrays of the same length
+(NaN where the indicator is not defined yet). Recursive smoothers (EMA, Wilder)
+are evaluated block-wise in closed form instead of a Python loop, and rolling
+windows use zero-copy sliding views. IndicatorEngine keeps the carry-over state
+so new bars can be appended with update() without recomputing the history.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Largest factor (1 - alpha) ** -k allowed inside one closed-form EMA block before it could overflow
+_MAX_BLOCK_GROWTH = 1e100
+
+
+def ema_filter(values, alpha, carry=None):
+    """
+    Exponential smoothing y[t] = alpha * x[t] + (1 - alpha) * y[t - 1].
+
+    With carry=None the series starts at y[0] = x[0] (pandas ewm(adjust=False));
+    otherwise carry is the previous y. NaN inputs repeat the previous y (ignore_na=True).
+    Returns (smoothed, last value).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if np.isnan(values).any():
+        return _skip_missing(lambda known, state: ema_filter(known, alpha, state), values, carry, carry)
+    out = np.empty_like(values)
+    if len(values) == 0:
+        return out, carry
+    start = 0
+    if carry is None:
+        out[0] = carry = values[0]
+        start = 1
+
+    decay = 1.0 - alpha
+    if decay <= 0:
+        out[start:] = values[start:]
+        return out, float(out[-1])
+
+    # Within a block: y[i] = decay**(i+1) * (carry + alpha * sum_k x[k] * decay**-(k+1))
+    block = int(min(4096, max(1, np.log(_MAX_BLOCK_GROWTH) / -np.log(decay))))
+    growth = decay ** -np.arange(1, block + 1, dtype=np.float64)
+    shrink = 1.0 / growth
+    for s in range(start, len(values), block):
+        chunk = values[s:s + block]
+        m = len(chunk)
+        acc = np.cumsum(chunk * growth[:m])
+        acc *= alpha
+        acc += carry
+        acc *= shrink[:m]
+        out[s:s + m] = acc
+        carry = float(acc[-1])
+    return out, carry
+
+
+def ema(values, span):
+    """Exponential moving average with span (alpha = 2 / (span + 1)), like pandas ewm(span, adjust=False)."""
+    return ema_filter(values, 2.0 / (span + 1))[0]
+
+
+def sma(values, window):
+    """Simple moving average; the first window - 1 values are NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full_like(values, np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return out
+
+
+def wilder(values, window, state=None):
+    """
+    Wilder smoothing (alpha = 1 / window) seeded with the simple mean of the first window values.
+
+    state carries {"avg", "pending"} between calls for streaming; returns (smoothed, state).
+    NaN inputs are skipped like in ema_filter().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if np.isnan(values).any():
+        return _skip_missing(lambda known, state: wilder(known, window, state), values, state,
+                             state["avg"] if state else None)
+    state = state or {"avg": None, "pending": np.empty(0)}
+    if state["avg"] is not None:
+        out, avg = ema_filter(values, 1.0 / window, state["avg"])
+        return out, {"avg": avg, "pending": state["pending"]}
+
+    combined = np.concatenate([state["pending"], values])
+    out = np.full_like(combined, np.nan)
+    if len(combined) < window:
+        return out[len(state["pending"]):], {"avg": None, "pending": combined}
+    seed = combined[:window].mean()
+    out[window - 1] = seed
+    out[window:], avg = ema_filter(combined[window:], 1.0 / window, seed)
+    return out[len(state["pending"]):], {"avg": avg, "pending": np.empty(0)}
+
+
+def rsi(close, window=14):
+    """Relative Strength Index with Wilder smoothing; NaN until window price changes are available."""
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    if len(close) > 1:
+        out[1:] = _rsi(np.diff(close), window)[0]
+    return out
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """MACD line, signal line and histogram."""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def bollinger(close, window=20, width=2.0):
+    """Bollinger bands: (middle, upper, lower) using the population standard deviation."""
+    return _bollinger(np.asarray(close, dtype=np.float64), window, width)
+
+
+def atr(high, low, close, window=14):
+    """Average True Range with Wilder smoothing."""
+    close = np.asarray(close, dtype=np.float64)
+    previous = np.r_[np.nan, close[:-1]]
+    return wilder(_true_range(np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64), previous),
+                  window)[0]
+
+
+def vwap(high, low, close, volume):
+    """Cumulative volume-weighted average price of the typical price (for one session)."""
+    volume = np.asarray(volume, dtype=np.float64)
+    typical = (np.asarray(high, dtype=np.float64) + np.asarray(low, dtype=np.float64) + close) / 3.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.cumsum(typical * volume) / np.cumsum(volume)
+
+
+def _skip_missing(smooth, values, state, previous):
+    """
+    smooth(values, state) -> (out, state) applied to the non-NaN values only.
+
+    A NaN input (a missing bar) leaves the average where it was instead of turning every later
+    value into NaN: its output repeats the one before it (previous, or NaN if None, at the start).
+    """
+    known = np.flatnonzero(~np.isnan(values))
+    smoothed, state = smooth(values[known], state)
+    last = np.searchsorted(known, np.arange(len(values)), side="right")
+    return np.r_[np.nan if previous is None else previous, smoothed][last], state
+
+
+def _rsi(delta, window, gain_state=None, loss_state=None):
+    """RSI for an array of price changes, carrying the Wilder gain/loss averages."""
+    gains, gain_state = wilder(np.maximum(delta, 0), window, gain_state)
+    losses, loss_state = wilder(np.maximum(-delta, 0), window, loss_state)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100.0 - 100.0 / (1.0 + gains / losses)
+    values[(losses == 0) & ~np.isnan(gains)] = 100.0
+    return values, gain_state, loss_state
+
+
+def _bollinger(history, window, width):
+    """Middle/upper/lower bands for every position of history (NaN before the first full window)."""
+    middle = np.full(len(history), np.nan)
+    deviation = np.full(len(history), np.nan)
+    if len(history) >= window:
+        windows = sliding_window_view(history, window)
+        middle[window - 1:] = windows.mean(axis=1)
+        deviation[window - 1:] = windows.std(axis=1)
+    return middle, middle + width * deviation, middle - width * deviation
+
+
+def _true_range(high, low, previous_close):
+    """max(high - low, |high - previous close|, |low - previous close|); high - low where there is no previous close."""
+    true_range = high - low
+    known = ~np.isnan(previous_close)
+    true_range[known] = np.maximum.reduce([true_range[known], np.abs(high[known] - previous_close[known]),
+                                           np.abs(low[known] - previous_close[known])])
+    return true_range
+
+
+class IndicatorEngine:
+    """
+    Compute a set of indicators over OHLCV arrays in one pass, incrementally.
+
+    update() accepts only the new bars and returns every indicator for them,
+    carrying EMA/Wilder averages, the previous close, the last window of closes
+    and VWAP running sums forward, so a streaming caller pays O(new bars) per tick.
+    """
+
+    def __init__(self, sma_window=10, ema_span=10, rsi_window=14, macd=(12, 26, 9), bollinger=(20, 2.0),
+                 atr_window=14):
+        self.sma_window = sma_window
+        self.ema_span = ema_span
+        self.rsi_window = rsi_window
+        self.macd_spans = macd
+        self.bollinger = bollinger
+        self.atr_window = atr_window
+
+        self._prev_close = None
+        self._tail = np.empty(0)
+        self._ema = None
+        self._macd_fast = self._macd_slow = self._macd_signal = None
+        self._gain = self._loss = self._tr = None
+        self._pv = self._volume = 0.0
+
+    def update(self, close, high=None, low=None, volume=None):
+        """Append new bars and return {name: array aligned with the new bars}."""
+        close = np.asarray(close, dtype=np.float64)
+        n = len(close)
+        result = {}
+
+        # Trailing windows: prepend the closes kept from the previous call
+        longest = max(self.sma_window, self.bollinger[0])
+        history = np.concatenate([self._tail, close])
+        offset = len(self._tail)
+        result["sma"] = sma(history, self.sma_window)[offset:]
+        middle, upper, lower = _bollinger(history, *self.bollinger)
+        result["bb_middle"], result["bb_upper"], result["bb_lower"] = middle[offset:], upper[offset:], lower[offset:]
+        self._tail = history[-(longest - 1):] if longest > 1 else np.empty(0)
+
+        # Exponential averages
+        result["ema"], self._ema = ema_filter(close, 2.0 / (self.ema_span + 1), self._ema)
+        fast, slow, signal = self.macd_spans
+        fast_ema, self._macd_fast = ema_filter(close, 2.0 / (fast + 1), self._macd_fast)
+        slow_ema, self._macd_slow = ema_filter(close, 2.0 / (slow + 1), self._macd_slow)
+        result["macd"] = fast_ema - slow_ema
+        result["macd_signal"], self._macd_signal = ema_filter(result["macd"], 2.0 / (signal + 1), self._macd_signal)
+        result["macd_hist"] = result["macd"] - result["macd_signal"]
+
+        # Price changes against the previous close (the very first bar has none)
+        previous = np.empty(n)
+        if n:
+            previous[0] = np.nan if self._prev_close is None else self._prev_close
+            previous[1:] = close[:-1]
+        delta = close - previous
+        changed = ~np.isnan(delta)
+
+        # Wilder RSI
+        result["rsi"] = np.full(n, np.nan)
+        if changed.any():
+            result["rsi"][changed], self._gain, self._loss = _rsi(delta[changed], self.rsi_window,
+                                                                   self._gain, self._loss)
+
+        # ATR and VWAP need the high/low (and volume) columns
+        if high is not None and low is not None:
+            high = np.asarray(high, dtype=np.float64)
+            low = np.asarray(low, dtype=np.float64)
+            result["atr"], self._tr = wilder(_true_range(high, low, previous), self.atr_window, self._tr)
+            if volume is not None:
+                volume = np.asarray(volume, dtype=np.float64)
+                pv = np.cumsum((high + low + close) / 3.0 * volume) + self._pv
+                cumulative_volume = np.cumsum(volume) + self._volume
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    result["vwap"] = pv / cumulative_volume
+                if n:
+                    self._pv, self._volume = float(pv[-1]), float(cumulative_volume[-1])
+
+        if n:
+            self._prev_close = float(close[-1])
+        return result
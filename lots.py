@@ -0,0 +1,160 @@
+import os
+
+from helpers import TTLCache, lookup_many
+from metrics import timed
+
+
+# A sale held for at least this many days after the purchase is a long-term gain
+LONG_TERM_DAYS = int(os.environ.get("LONG_TERM_DAYS", 365))
+
+# Matched lots per user, tagged with the user's latest history id so the next trade invalidates them
+# (also across worker processes); the TTL only bounds how long an idle user's lots stay in memory
+lots_cache = TTLCache(24 * 60 * 60, int(os.environ.get("LOTS_CACHE_SIZE", 256)))
+
+
+@timed("report")
+def match_lots(rows):
+    """
+    Match sells to buys first-in first-out, lot by lot.
+
+    rows are one user's history rows (symbol, shares, price, method, transacted_at) in the order
+    they were transacted. Returns (closed, open) DataFrames: closed has one row per part of a buy
+    lot consumed by a sell (symbol, shares, bought_at, buy_price, sold_at, sell_price, gain,
+    holding_days, long_term), open one row per buy lot or remainder still held (symbol, shares,
+    bought_at, buy_price).
+
+    Instead of walking the ledger with a queue of lots, each symbol's buys and sells are laid
+    out as consecutive intervals on its cumulative share count. FIFO pairs a buy with a sell
+    exactly where their intervals overlap, so cutting the share axis at every interval end and
+    looking up both owners of each piece with a binary search matches every trade at once.
+    """
+    import numpy as np
+    import pandas as pd
+
+    closed_columns = ["symbol", "shares", "bought_at", "buy_price", "sold_at", "sell_price", "gain", "holding_days",
+                      "long_term"]
+    open_columns = ["symbol", "shares", "bought_at", "buy_price"]
+    trades = pd.DataFrame.from_records(list(rows), columns=["symbol", "shares", "price", "method", "transacted_at"])
+    if trades.empty:
+        return pd.DataFrame(columns=closed_columns), pd.DataFrame(columns=open_columns)
+    # Make each symbol contiguous, keeping the order of its trades; codes then increase with the symbol
+    trades = trades.sort_values("symbol", kind="stable", ignore_index=True)
+    codes, symbols = pd.factorize(trades["symbol"])
+    count = len(symbols)
+    sell = (trades["method"].str.upper() == "SELL").to_numpy()
+    shares = trades["shares"].to_numpy(dtype=np.int64)
+    price = trades["price"].to_numpy(dtype=np.float64)
+    transacted_at = trades["transacted_at"].to_numpy(dtype=object)
+
+    buy_code, buy_shares = codes[~sell], shares[~sell]
+    sell_code, sell_shares = codes[sell], shares[sell]
+    bought = np.bincount(buy_code, weights=buy_shares, minlength=count).astype(np.int64)
+    # Sells beyond what was bought (only in ledgers written by older versions) have no lot to match
+    sold = np.minimum(np.bincount(sell_code, weights=sell_shares, minlength=count).astype(np.int64), bought)
+    buy_end = pd.Series(buy_shares).groupby(buy_code).cumsum().to_numpy()
+    sell_end = np.minimum(pd.Series(sell_shares).groupby(sell_code).cumsum().to_numpy(), bought[sell_code])
+
+    # Put every symbol's share axis on one line: position p of symbol c becomes c * span + p
+    span = int(bought.max()) + 1
+    buy_key = buy_code * span + buy_end
+    sell_key = sell_code * span + sell_end
+    cuts = np.unique(np.concatenate([np.arange(count) * span, buy_key, sell_key]))
+    start, end = cuts[:-1], cuts[1:]
+    inside = end // span == start // span
+    start, end = start[inside], end[inside]
+    code = start // span
+    lot = np.searchsorted(buy_key, start, side="right")
+    matched = start - code * span < sold[code]
+    sale = np.searchsorted(sell_key, start[matched], side="right")
+
+    buy_rows = np.flatnonzero(~sell)[lot]
+    sell_rows = np.flatnonzero(sell)[sale]
+    closed_rows = buy_rows[matched]
+    closed = pd.DataFrame({
+        "symbol": symbols[code[matched]],
+        "shares": end[matched] - start[matched],
+        "bought_at": transacted_at[closed_rows],
+        "buy_price": price[closed_rows],
+        "sold_at": transacted_at[sell_rows],
+        "sell_price": price[sell_rows],
+    })
+    closed["gain"] = closed["shares"] * (closed["sell_price"] - closed["buy_price"])
+    closed["holding_days"] = (pd.to_datetime(closed["sold_at"]) - pd.to_datetime(closed["bought_at"])).dt.days
+    closed["long_term"] = closed["holding_days"] >= LONG_TERM_DAYS
+
+    open_rows = buy_rows[~matched]
+    open_ = pd.DataFrame({
+        "symbol": symbols[code[~matched]],
+        "shares": end[~matched] - start[~matched],
+        "bought_at": transacted_at[open_rows],
+        "buy_price": price[open_rows],
+    })
+    return closed, open_
+
+
+def user_lots(db, user_id):
+    """
+    The parts of user_id's lot report that only change when they trade, recomputed only after a trade.
+
+    A dict with closed (match_lots() closed lots as records), realized (gain per symbol),
+    totals (realized, short_term and long_term gains) and open (the open lots DataFrame).
+    """
+    latest = db.execute("SELECT MAX(id) AS id FROM history WHERE user_id = ?", user_id)[0]["id"]
+    cached = lots_cache.get(user_id)
+    if cached is not None and cached[0] == latest:
+        return cached[1]
+    rows = db.execute("SELECT symbol, shares, price, method, transacted_at FROM history WHERE user_id = ? \
+        ORDER BY transacted_at, id", user_id)
+    closed, open_ = match_lots(rows)
+    long_term = closed["long_term"].astype(bool)
+    lots = {
+        "closed": _records(closed),
+        "realized": closed.groupby("symbol")["gain"].sum(),
+        "totals": {
+            "realized": float(closed["gain"].sum()),
+            "short_term": float(closed.loc[~long_term, "gain"].sum()),
+            "long_term": float(closed.loc[long_term, "gain"].sum()),
+        },
+        "open": open_,
+    }
+    lots_cache.set(user_id, (latest, lots))
+    return lots
+
+
+def lot_report(db, user_id):
+    """
+    FIFO realized and unrealized P&L of user_id as a JSON-ready dict.
+
+    Keys: closed and open (the lots of match_lots(), open ones valued at the current price),
+    symbols (per-symbol totals) and totals. Open lots are valued with one lookup_many() call;
+    lots whose symbol has no quote have a price, value and gain of None, and make the unrealized
+    total None too.
+    """
+    lots = user_lots(db, user_id)
+    open_ = lots["open"]
+    quotes = lookup_many(open_["symbol"].unique())
+    prices = {symbol: quote["price"] for symbol, quote in quotes.items() if quote}
+    open_ = open_.assign(price=open_["symbol"].map(prices).astype("float64"), cost=open_["shares"] * open_["buy_price"])
+    open_["value"] = open_["shares"] * open_["price"]
+    open_["gain"] = open_["value"] - open_["cost"]
+
+    # Unrealized P&L of a symbol is unknown (None) if any of its lots could not be valued
+    held = open_.groupby("symbol")[["shares", "cost", "gain"]].sum().rename(columns={"gain": "unrealized"})
+    held.loc[open_["price"].isna().groupby(open_["symbol"]).any(), "unrealized"] = None
+    symbols = held.join(lots["realized"].rename("realized"), how="outer")
+    symbols[["shares", "cost", "realized"]] = symbols[["shares", "cost", "realized"]].fillna(0)
+    # A symbol with no open lots has nothing left to value: its unrealized P&L is 0, not unknown
+    symbols.loc[~symbols.index.isin(held.index), "unrealized"] = 0.0
+    symbols["shares"] = symbols["shares"].astype("int64")
+    return {
+        "closed": lots["closed"],
+        "open": _records(open_),
+        "symbols": _records(symbols.reset_index()),
+        "totals": {**lots["totals"],
+                   "unrealized": None if open_["price"].isna().any() else float(open_["gain"].sum())},
+    }
+
+
+def _records(frame):
+    """DataFrame rows as dicts of plain Python values, with None for missing ones."""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
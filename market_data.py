@@ -0,0 +1,315 @@
+import json
+import logging
+import os
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+from bar_store import STORED_INTERVALS
+from helpers import INSTANCE_DIR, SingleFlight, TTLCache, bar_store
+from providers import provider
+from symbols import SYMBOL_PATTERN, exchange_timezone
+
+log = logging.getLogger(__name__)
+
+
+# Bar cache configuration; ranges that end before today never change, so they can live much longer
+BAR_TTL = float(os.environ.get("BAR_TTL", 60))
+BAR_HISTORY_TTL = float(os.environ.get("BAR_HISTORY_TTL", 24 * 60 * 60))
+BAR_CACHE_SIZE = int(os.environ.get("BAR_CACHE_SIZE", 256))
+
+# Yahoo only serves 1m bars for roughly the last week; older days fall back to coarser base series
+ONE_MINUTE_DAYS = int(os.environ.get("ONE_MINUTE_DAYS", 7))
+
+# Bar widths that can be derived locally from a finer base series
+INTRADAY_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "90m": 90}
+CALENDAR_PERIODS = {"1mo": 1, "3mo": 3}
+
+# Analyst recommendations change at most daily; they are kept (in memory and under the instance
+# directory) until local midnight RECOMMENDATIONS_TTL_DAYS after they were fetched
+RECOMMENDATIONS_TTL_DAYS = int(os.environ.get("RECOMMENDATIONS_TTL_DAYS", 1))
+RECOMMENDATIONS_DIR = os.path.join(INSTANCE_DIR, "recommendations")
+
+bar_cache = TTLCache(BAR_TTL, BAR_CACHE_SIZE)
+recommendations_cache = TTLCache(BAR_HISTORY_TTL, BAR_CACHE_SIZE)
+
+# Identical concurrent downloads (e.g. many users submitting the same ticker) share one request
+download_flight = SingleFlight("downloads")
+
+
+def normalise_symbol(ticker):
+    """ticker upper-cased and stripped; raises ValueError unless it looks like a Yahoo symbol."""
+    symbol = ticker.upper().strip()
+    if not SYMBOL_PATTERN.match(symbol):
+        raise ValueError(f"invalid symbol {ticker!r}")
+    return symbol
+
+
+def bar_key(ticker, start, end, interval):
+    """Normalised cache key for a bar series; raises ValueError for an invalid ticker."""
+    return (normalise_symbol(ticker), str(start), str(end), interval)
+
+
+def exchange_today(symbol, interval="1d"):
+    """
+    Today's date (YYYY-MM-DD) on the exchange symbol trades on; earlier days are completed sessions.
+
+    The server's own date can be a day ahead of (or behind) the exchange's, which would
+    persist a session that is still open. The timezone comes from the stored series if
+    there is one, otherwise from the symbol's exchange suffix.
+    """
+    try:
+        tz = bar_store.timezone(symbol, interval)
+    except OSError:
+        tz = None
+    return pd.Timestamp.now(tz=tz or exchange_timezone(symbol)).strftime("%Y-%m-%d")
+
+
+def get_bars(ticker, start, end, interval):
+    """
+    Return OHLCV bars for ticker between start and end (YYYY-MM-DD strings).
+
+    Every caller asking for the same (ticker, start, end, interval) shares one
+    cached DataFrame, so it must be treated as read-only.
+    """
+    key = bar_key(ticker, start, end, interval)
+    data = bar_cache.get(key)
+    if data is None:
+        data = download_flight.do(key, _download_and_cache, key)
+    return data
+
+
+def get_chart_bars(ticker, start, end, interval):
+    """
+    Return bars at interval, derived locally from the finest base series for the range.
+
+    Intraday intervals are aggregated from 1m bars (or 5m/2m bars for days older than
+    ONE_MINUTE_DAYS) and monthly/quarterly bars from daily bars, so switching the
+    interval for an already loaded range needs no download.
+    """
+    base = _base_interval(start, interval)
+    if base == interval:
+        return get_bars(ticker, start, end, interval)
+
+    data = get_bars(ticker, start, end, base)
+    if data.empty:
+        # The provider may not have the finer series for this range; ask for the interval directly
+        return get_bars(ticker, start, end, interval)
+    return resample_bars(data, interval)
+
+
+def get_daily_closes(tickers, start, end):
+    """
+    Daily closes of several tickers for completed days start <= date < end, one column per ticker.
+
+    Days are served from the bar store. The tickers whose stored series does not cover the
+    range are fetched together in one multi-ticker provider call and stored, so asking again
+    needs no download. Days without a bar for a ticker are NaN.
+    """
+    tickers = sorted({ticker.upper().strip() for ticker in tickers})
+    # A day counts as completed only once every ticker's exchange has moved past it
+    end = min([end] + [exchange_today(ticker) for ticker in tickers])
+    closes = {}
+    if start < end and tickers:
+        try:
+            gaps = {ticker: bar_store.missing(ticker, "1d", start, end) for ticker in tickers}
+            missing = [ticker for ticker in tickers if gaps[ticker]]
+            if missing:
+                # One range covering every gap, so a single request serves all missing tickers
+                gap_start = min(gap[0] for ticker in missing for gap in gaps[ticker])
+                gap_end = max(gap[1] for ticker in missing for gap in gaps[ticker])
+                for ticker, fetched in provider.bars_many(missing, gap_start, gap_end, "1d").items():
+                    if not fetched.empty:
+                        bar_store.write(ticker, "1d", fetched, gap_start, gap_end)
+            for ticker in tickers:
+                stored = bar_store.read(ticker, "1d", start, end)
+                if stored is not None and not stored.empty:
+                    closes[ticker] = stored["Close"]
+        except OSError as e:
+            log.warning("Error reading bar store for daily closes: %s", e)
+            closes = {ticker: data["Close"] for ticker, data in provider.bars_many(tickers, start, end, "1d").items()
+                      if not data.empty}
+    return pd.DataFrame(closes, columns=tickers)
+
+
+def resample_bars(data, interval):
+    """
+    Aggregate OHLCV bars into coarser interval bars.
+
+    Buckets are found with one vectorised pass over the timestamps and reduced
+    with numpy ufunc.reduceat: open=first, high=max, low=min, close=last, volume=sum.
+    Intraday buckets are aligned to the first bar of the series (the session open).
+    """
+    valid = ~np.isnan(data["Close"].to_numpy(dtype=float))
+    if not valid.all():
+        data = data[valid]
+    if data.empty:
+        return data
+
+    index = data.index
+    if interval in INTRADAY_MINUTES:
+        width = INTRADAY_MINUTES[interval] * 60 * 10**9
+        offsets = (index.asi8 - index.asi8[0]) // width
+    elif interval in CALENDAR_PERIODS:
+        offsets = (index.year.to_numpy() * 12 + index.month.to_numpy() - 1) // CALENDAR_PERIODS[interval]
+    else:
+        raise ValueError(f"cannot resample to interval {interval!r}")
+
+    starts = np.flatnonzero(np.r_[True, offsets[1:] != offsets[:-1]])
+    ends = np.r_[starts[1:], len(offsets)] - 1
+
+    if interval in INTRADAY_MINUTES:
+        labels = index[0] + pd.to_timedelta(offsets[starts] * INTRADAY_MINUTES[interval], unit="m")
+    else:
+        months = offsets[starts] * CALENDAR_PERIODS[interval]
+        labels = pd.to_datetime({"year": months // 12, "month": months % 12 + 1, "day": 1})
+        labels = pd.DatetimeIndex(labels).tz_localize(index.tz)
+
+    columns = {}
+    for column in data.columns:
+        values = data[column].to_numpy()
+        if column == "Open":
+            columns[column] = values[starts]
+        elif column == "High":
+            columns[column] = np.maximum.reduceat(values, starts)
+        elif column == "Low":
+            columns[column] = np.minimum.reduceat(values, starts)
+        elif column == "Volume":
+            columns[column] = np.add.reduceat(values, starts)
+        else:
+            columns[column] = values[ends]
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(labels, name=index.name))
+
+
+def get_recommendations(ticker):
+    """
+    Analyst recommendation counts for ticker (read-only).
+
+    Served from memory, then from the copy saved under RECOMMENDATIONS_DIR, and only
+    fetched from the provider once that copy has passed recommendations_expiry(),
+    so restarts and repeat views cost no network round trip.
+    """
+    symbol = normalise_symbol(ticker)
+    data = recommendations_cache.get(symbol)
+    if data is None:
+        data = download_flight.do(("recommendations", symbol), _load_recommendations, symbol)
+    return data
+
+
+def recommendations_expiry(fetched_at):
+    """
+    When recommendations fetched at fetched_at (epoch seconds) go stale.
+
+    That is local midnight RECOMMENDATIONS_TTL_DAYS later, or the first of the next
+    month if sooner, because the relative period labels ('0m', '-1m', ...) shift then.
+    """
+    day = datetime.fromtimestamp(fetched_at).date()
+    next_month = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+    expires = min(day + timedelta(days=RECOMMENDATIONS_TTL_DAYS), next_month)
+    return datetime.combine(expires, datetime.min.time()).timestamp()
+
+
+def bar_cache_stats():
+    """Return hit/miss counters for the bar cache."""
+    return bar_cache.stats()
+
+
+def _base_interval(start, interval):
+    """Finest interval worth downloading to derive interval bars for a range beginning at start."""
+    if interval in CALENDAR_PERIODS:
+        return "1d"
+    if interval not in INTRADAY_MINUTES:
+        return interval
+    day = datetime.strptime(str(start)[:10], "%Y-%m-%d").date()
+    if datetime.now().date() - day < timedelta(days=ONE_MINUTE_DAYS):
+        return "1m"
+    if INTRADAY_MINUTES[interval] % 5 == 0:
+        return "5m"
+    return interval
+
+
+def _download_and_cache(key):
+    """Load one bar series (from the bar store where possible) and store it in bar_cache."""
+    ticker, start, end, interval = key
+    today = exchange_today(ticker, interval)
+    if interval in STORED_INTERVALS:
+        data = _load_stored(ticker, start, end, interval, today)
+    else:
+        data = _download(ticker, start, end, interval)
+    ttl = BAR_HISTORY_TTL if end <= today else BAR_TTL
+    if not data.empty:
+        bar_cache.set(key, data, ttl=ttl)
+    return data
+
+
+def _load_stored(ticker, start, end, interval, today):
+    """
+    Serve completed days from the on-disk bar store, downloading only the ranges it is missing.
+
+    Bars for today (the exchange's today) are still in progress, so they are always downloaded
+    and never persisted. Only the parts of start..end the store lacks are downloaded.
+    """
+    parts = []
+    closed_end = min(end, today)
+    if start < closed_end:
+        try:
+            for gap_start, gap_end in bar_store.missing(ticker, interval, start, closed_end):
+                fetched = _download(ticker, gap_start, gap_end, interval)
+                if not fetched.empty:
+                    bar_store.write(ticker, interval, fetched, gap_start, gap_end)
+            stored = bar_store.read(ticker, interval, start, closed_end)
+        except OSError as e:
+            log.warning("Error reading bar store for '%s' (%s): %s", ticker, interval, e)
+            stored = _download(ticker, start, closed_end, interval)
+        if stored is not None:
+            parts.append(stored)
+    if end > today:
+        parts.append(_download(ticker, max(start, today), end, interval))
+
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return pd.DataFrame()
+    return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+
+def _download(ticker, start, end, interval):
+    """Download bars from the market data provider."""
+    return provider.bars(ticker, start, end, interval)
+
+
+def _load_recommendations(symbol):
+    """Read recommendations from disk, or fetch and save them when missing or stale, and cache them in memory."""
+    path = os.path.join(RECOMMENDATIONS_DIR, f"{symbol}.json")
+    data, expires_at = _read_recommendations(path)
+    if data is None or expires_at <= time.time():
+        data = provider.recommendations(symbol)
+        if data is None or data.empty:
+            # No analyst coverage (common outside the US) is kept like any other answer, so
+            # repeat views until it expires cost no provider call either
+            data = pd.DataFrame(columns=["period"])
+        expires_at = recommendations_expiry(time.time())
+        _write_recommendations(path, data, expires_at)
+    recommendations_cache.set(symbol, data, ttl=expires_at - time.time())
+    return data
+
+
+def _read_recommendations(path):
+    """Return (DataFrame, expires_at) saved at path, or (None, 0) if there is none."""
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, 0
+    return pd.DataFrame(saved["data"], columns=saved["columns"]), saved["expires_at"]
+
+
+def _write_recommendations(path, data, expires_at):
+    """Save recommendations atomically (write a temporary file, then rename it over path)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    split = data.to_dict(orient="split")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"expires_at": expires_at, "columns": split["columns"], "data": split["data"]}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,123 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Prometheus' default latency buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Thread-safe latency histogram with one series per label combination.
+
+    observe() is a bisect and three additions under a lock, cheap enough for the
+    hot path. render() produces the Prometheus text exposition format. Values are
+    per process; with several workers, each one reports its own.
+    """
+
+    instances = []
+
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        Histogram.instances.append(self)
+
+    def observe(self, labels, seconds):
+        """Record one duration for the label values in labels (a tuple ordered like labelnames)."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def snapshot(self):
+        """{labels: (per-bucket counts, sum, count)} for every series observed so far."""
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.snapshot().items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return "\n".join(lines)
+
+
+# Whole requests by route, and the operations inside them by kind (provider, db, template, figure, callback)
+request_seconds = Histogram("finance_request_duration_seconds", "Time spent handling HTTP requests.",
+                            ("route", "method", "status"))
+operation_seconds = Histogram("finance_operation_duration_seconds",
+                              "Time spent in instrumented operations on the request path.", ("kind", "operation"))
+
+
+@contextmanager
+def timer(kind, operation):
+    """Record the duration of the with-block in operation_seconds, also when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_seconds.observe((kind, operation), time.perf_counter() - started)
+
+
+def timed(kind, operation=None):
+    """Decorator form of timer(); operation defaults to the function's name."""
+    def decorator(f):
+        name = operation or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with timer(kind, name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Instrumented:
+    """Proxy that times every method call on target as (kind, method name)."""
+
+    def __init__(self, target, kind):
+        self._target = target
+        self._kind = kind
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        return timed(self._kind, name)(attribute)
+
+
+def render(gauges=()):
+    """
+    Every histogram plus gauges in the Prometheus text format.
+
+    gauges is an iterable of (name, documentation, labelnames, {label values tuple: value}).
+    """
+    parts = [histogram.render() for histogram in Histogram.instances]
+    for name, documentation, labelnames, values in gauges:
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+        for labels, value in sorted(values.items()):
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in zip(labelnames, labels))
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
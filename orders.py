@@ -0,0 +1,100 @@
+from helpers import lookup_many
+
+
+class OrderError(Exception):
+    """An order that cannot be executed, e.g. for lack of cash, shares or a price."""
+
+
+def execute_order(db, user_id, method, symbol, shares, price, name=None):
+    """
+    Execute a single BUY or SELL at price in one transaction.
+
+    Returns the fill as a dict; raises OrderError (and changes nothing) if the
+    user cannot afford the purchase or does not own enough shares.
+    """
+    fill = _fill(method, symbol, shares, price, name or symbol)
+    execute_fills(db, user_id, [fill])
+    return fill
+
+
+def place_orders(db, user_id, orders):
+    """
+    Execute a basket of (method, symbol, shares) orders atomically.
+
+    Prices are fetched once per distinct symbol before the transaction starts,
+    so no network I/O happens while the write lock is held. Either every order
+    is filled or none is. Returns the list of fills.
+    """
+    if not orders:
+        raise OrderError("no orders submitted")
+    quotes = lookup_many(symbol for _, symbol, _ in orders)
+    fills = []
+    for method, symbol, shares in orders:
+        quote = quotes.get(symbol)
+        if not quote:
+            raise OrderError(f"Could not get current price for {symbol}.")
+        fills.append(_fill(method, quote["symbol"], shares, quote["price"], quote["name"]))
+    execute_fills(db, user_id, fills)
+    return fills
+
+
+def execute_fills(db, user_id, fills):
+    """
+    Apply fills to cash, portfolio and history inside one BEGIN IMMEDIATE transaction.
+
+    The portfolio row of each symbol is kept in step with history: shares, cost basis and
+    realized P&L are updated incrementally, so reading them never means replaying the ledger
+    (holdings.check_holdings() verifies that they agree).
+
+    Cash and share balances are changed with conditional UPDATEs, so two concurrent
+    orders can never overdraw an account. Sells are applied first so their proceeds
+    can fund the buys in the same basket.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for fill in sorted(fills, key=lambda fill: fill["method"] != "SELL"):
+            if fill["method"] == "SELL":
+                _apply_sell(db, user_id, fill)
+            else:
+                _apply_buy(db, user_id, fill)
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+
+
+def _fill(method, symbol, shares, price, name):
+    method = method.upper()
+    if method not in ("BUY", "SELL"):
+        raise OrderError(f"unknown order type '{method}'")
+    if shares <= 0:
+        raise OrderError("must provide a positive number of shares")
+    return {"method": method, "symbol": symbol, "name": name, "shares": shares,
+            "price": price, "total": price * shares}
+
+
+def _apply_buy(db, user_id, fill):
+    if db.execute("UPDATE users SET cash = cash - ? WHERE id = ? AND cash >= ?",
+                  fill["total"], user_id, fill["total"]) != 1:
+        raise OrderError("Insufficient Cash. Failed Purchase.")
+    db.execute("INSERT INTO history (user_id, symbol, shares, price, method) VALUES (?, ?, ?, ?, ?)",
+               user_id, fill["symbol"], fill["shares"], fill["price"], "BUY")
+    db.execute("INSERT INTO portfolio (user_id, symbol, shares, cost_basis) VALUES (?, ?, ?, ?) \
+        ON CONFLICT (user_id, symbol) DO UPDATE SET shares = shares + excluded.shares, \
+        cost_basis = cost_basis + excluded.cost_basis",
+               user_id, fill["symbol"], fill["shares"], fill["total"])
+
+
+def _apply_sell(db, user_id, fill):
+    # Average cost: the sold fraction of the basis leaves with the shares, the rest of the proceeds is realized
+    # (every expression on the right-hand side reads the row as it was before this UPDATE)
+    if db.execute("UPDATE portfolio SET shares = shares - ?, \
+        realized_pnl = realized_pnl + ? - cost_basis * ? / shares, \
+        cost_basis = CASE WHEN shares = ? THEN 0 ELSE cost_basis - cost_basis * ? / shares END \
+        WHERE user_id = ? AND symbol = ? AND shares >= ?",
+                  fill["shares"], fill["total"], fill["shares"], fill["shares"], fill["shares"],
+                  user_id, fill["symbol"], fill["shares"]) != 1:
+        raise OrderError(f"Insufficient shares of {fill['symbol']} owned to sell")
+    db.execute("UPDATE users SET cash = cash + ? WHERE id = ?", fill["total"], user_id)
+    db.execute("INSERT INTO history (user_id, symbol, shares, price, method) VALUES (?, ?, ?, ?, ?)",
+               user_id, fill["symbol"], fill["shares"], fill["price"], "SELL")
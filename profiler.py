@@ -0,0 +1,149 @@
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request
+
+log = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """
+    Opt-in profiling of individual requests, Dash callbacks included.
+
+    A request is profiled when it carries an X-Profile header equal to token, or
+    at random with probability sample_rate. In "cprofile" mode the request's thread
+    runs under cProfile and a .pstats file is written; in "sample" mode a helper
+    thread records the request thread's stack every interval seconds and writes
+    a .collapsed file (one "frame;frame;frame count" line per stack, the input
+    format of flamegraph.pl and speedscope). Requests faster than min_duration
+    seconds are not written. Nothing runs for requests that are not selected.
+
+    Only one request per process runs under cProfile at a time: from Python 3.12 it
+    hooks the process-wide sys.monitoring, so a concurrent session cannot start
+    (and would see every thread). A request selected while another is being
+    profiled simply runs unprofiled.
+    """
+
+    header = "X-Profile"
+
+    def __init__(self, directory, sample_rate=0.0, token=None, mode="cprofile", interval=0.005, min_duration=0.0):
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"unknown profiler mode {mode!r}")
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.mode = mode
+        self.interval = interval
+        self.min_duration = min_duration
+        self._cprofile_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or bool(self.token)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        log.info("Request profiling on (%s, sample rate %s, header %s) writing to %s", self.mode, self.sample_rate,
+                 "enabled" if self.token else "disabled", self.directory)
+
+    def _selected(self):
+        if self.token and hmac.compare_digest(request.headers.get(self.header, "").encode(), self.token.encode()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _start(self):
+        if not self._selected():
+            return
+        if self.mode == "cprofile":
+            if not self._cprofile_lock.acquire(blocking=False):
+                return
+            recorder = cProfile.Profile()
+            try:
+                recorder.enable()
+            except ValueError as e:
+                # Another profiler (e.g. a debugger or coverage) already holds sys.monitoring
+                self._cprofile_lock.release()
+                log.warning("Not profiling %s %s: %s", request.method, request.path, e)
+                return
+        else:
+            recorder = _StackSampler(threading.get_ident(), self.interval)
+            recorder.start()
+        g.profile = (recorder, time.perf_counter(), _label())
+
+    def _finish(self, exception):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        recorder, started, label = profile
+        if self.mode == "cprofile":
+            recorder.disable()
+            self._cprofile_lock.release()
+        else:
+            recorder.stop()
+        duration = time.perf_counter() - started
+        # A request shorter than one sampling interval has no samples to write
+        if duration < self.min_duration or (self.mode == "sample" and not recorder.counts):
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{int(duration * 1000)}ms-{label}-{uuid.uuid4().hex[:6]}"
+        try:
+            if self.mode == "cprofile":
+                path = os.path.join(self.directory, f"{name}.pstats")
+                recorder.dump_stats(path)
+            else:
+                path = os.path.join(self.directory, f"{name}.collapsed")
+                with open(path, "w") as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in recorder.counts.items())
+        except OSError as e:
+            log.warning("Could not write profile for %s: %s", label, e)
+            return
+        log.info("Profiled %s %s in %.1f ms: %s", request.method, request.path, duration * 1000, path)
+
+
+class _StackSampler(threading.Thread):
+    """Count the stacks of another thread, sampled every interval seconds."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _label():
+    """File-name-safe description of the request; Dash callbacks are named after their outputs."""
+    label = f"{request.method}{request.path}"
+    if request.path.endswith("_dash-update-component"):
+        outputs = (request.get_json(silent=True) or {}).get("outputs", [])
+        outputs = outputs if isinstance(outputs, list) else [outputs]
+        label = "dash-" + "-".join(str(output.get("id", "")) for output in outputs)
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:80]
@@ -0,0 +1,235 @@
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from metrics import Instrumented
+
+
+# Which market data source to use: "yfinance" (default) or "synthetic"
+MARKET_DATA_PROVIDER = os.environ.get("MARKET_DATA_PROVIDER", "yfinance")
+# Seed and artificial per-call latency (seconds) for the synthetic provider
+SYNTHETIC_SEED = int(os.environ.get("SYNTHETIC_SEED", 0))
+SYNTHETIC_LATENCY = float(os.environ.get("SYNTHETIC_LATENCY", 0))
+
+
+class MarketDataProvider:
+    """
+    Interface for a source of quotes, company names, OHLCV bars and analyst recommendations.
+
+    Bars are returned as yfinance-style DataFrames (Open/High/Low/Close/Volume
+    columns indexed by Date or Datetime) so every consumer is provider-agnostic.
+    """
+
+    name = "base"
+
+    def latest_price(self, symbol, period="1d"):
+        """Return the most recent close within period, or None if there is no data."""
+        raise NotImplementedError
+
+    def latest_prices(self, symbols):
+        """Return {symbol: most recent close} for several symbols, omitting those without data."""
+        prices = {}
+        for symbol in symbols:
+            price = self.latest_price(symbol, period="5d")
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def company_name(self, symbol):
+        """Return the company's display name."""
+        raise NotImplementedError
+
+    def bars(self, ticker, start, end, interval):
+        """Return OHLCV bars for start <= timestamp < end (YYYY-MM-DD strings)."""
+        raise NotImplementedError
+
+    def bars_many(self, tickers, start, end, interval):
+        """Return {ticker: bars} for several tickers; an empty DataFrame for tickers without data."""
+        return {ticker: self.bars(ticker, start, end, interval) for ticker in tickers}
+
+    def recommendations(self, ticker):
+        """Return analyst recommendation counts (period, strongBuy, buy, hold, sell, strongSell)."""
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Live data from Yahoo Finance via yfinance."""
+
+    name = "yfinance"
+
+    def latest_price(self, symbol, period="1d"):
+        hist = yf.Ticker(symbol).history(period=period, auto_adjust=True)
+        if hist.empty:
+            return None
+        return float(hist["Close"].iloc[-1])
+
+    def latest_prices(self, symbols):
+        # One multi-ticker request instead of one request per symbol
+        data = yf.download(list(symbols), period="5d", interval="1d", auto_adjust=True,
+                           group_by="column", progress=False)
+        if data.empty:
+            return {}
+        closes = data["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(name=list(symbols)[0])
+        last = closes.ffill().iloc[-1]
+        return {symbol: float(price) for symbol, price in last.items() if pd.notna(price)}
+
+    def company_name(self, symbol):
+        company_info = yf.Ticker(symbol).info
+        return company_info.get("longName") or company_info.get("shortName") or symbol
+
+    def bars(self, ticker, start, end, interval):
+        return pd.DataFrame(yf.download(ticker, start=start, end=end, multi_level_index=False, interval=interval,
+                                         progress=False))
+
+    def bars_many(self, tickers, start, end, interval):
+        # One multi-ticker request instead of one request per ticker
+        tickers = list(tickers)
+        data = yf.download(tickers, start=start, end=end, interval=interval, group_by="ticker", progress=False)
+        bars = {}
+        for ticker in tickers:
+            if isinstance(data.columns, pd.MultiIndex):
+                frame = data[ticker] if ticker in data.columns.get_level_values(0) else pd.DataFrame()
+            else:
+                frame = data if len(tickers) == 1 else pd.DataFrame()
+            bars[ticker] = pd.DataFrame(frame).dropna(how="all")
+        return bars
+
+    def recommendations(self, ticker):
+        return yf.Ticker(ticker).recommendations
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Deterministic offline data: seeded geometric random walks per symbol.
+
+    The same symbol and seed always produce the same prices, so the app can be
+    run, load-tested and benchmarked without network access. SYNTHETIC_LATENCY
+    adds a fixed delay per call to mimic a remote provider.
+    """
+
+    name = "synthetic"
+    origin = "1980-01-01"
+    session_minutes = 390
+
+    def __init__(self, seed=0, latency=0):
+        self.seed = seed
+        self.latency = latency
+        self._daily = {}
+
+    def latest_price(self, symbol, period="1d"):
+        self._sleep()
+        daily = self._daily_bars(symbol)
+        return float(daily["Close"].iloc[-1])
+
+    def company_name(self, symbol):
+        self._sleep()
+        return f"{symbol.upper()} Synthetic Inc."
+
+    def bars(self, ticker, start, end, interval):
+        self._sleep()
+        return self._bars(ticker, start, end, interval)
+
+    def bars_many(self, tickers, start, end, interval):
+        # Costs one round trip, like a multi-ticker download
+        self._sleep()
+        return {ticker: self._bars(ticker, start, end, interval) for ticker in tickers}
+
+    def _bars(self, ticker, start, end, interval):
+        if interval.endswith("m") and not interval.endswith("mo"):
+            return self._intraday_bars(ticker, start, end, int(interval[:-1]))
+
+        daily = self._daily_bars(ticker)
+        daily = daily[(daily.index >= pd.Timestamp(start)) & (daily.index < pd.Timestamp(end))]
+        rule = {"1d": None, "5d": "W-MON", "1wk": "W-MON", "1mo": "MS", "3mo": "QS"}.get(interval)
+        if rule is None:
+            return daily.copy()
+        aggregated = daily.resample(rule, label="left", closed="left").agg(
+            {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"})
+        return aggregated.dropna(subset=["Close"])
+
+    def recommendations(self, ticker):
+        self._sleep()
+        rng = np.random.default_rng([self.seed, self._symbol_seed(ticker), 1])
+        counts = rng.integers(0, 25, size=(4, 5))
+        data = pd.DataFrame(counts, columns=["strongBuy", "buy", "hold", "sell", "strongSell"])
+        data.insert(0, "period", ["0m", "-1m", "-2m", "-3m"])
+        return data
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _symbol_seed(self, symbol):
+        return zlib.crc32(symbol.upper().strip().encode())
+
+    def _daily_bars(self, symbol):
+        """Daily bars from 1980 to today for symbol, generated once per process."""
+        symbol = symbol.upper().strip()
+        today = datetime.now().date()
+        cached = self._daily.get(symbol)
+        if cached is not None and cached[0] == today:
+            return cached[1]
+
+        index = pd.bdate_range(self.origin, today, name="Date")
+        rng = np.random.default_rng([self.seed, self._symbol_seed(symbol)])
+        base, target = rng.uniform(5, 50), rng.uniform(20, 500)
+        # Brownian bridge in log space from base (1980) to target (today) keeps prices plausible
+        walk = np.cumsum(rng.normal(0, 0.012, len(index)))
+        ramp = np.linspace(0, 1, len(index))
+        close = base * np.exp(walk - ramp * walk[-1] + ramp * np.log(target / base))
+        open_ = np.r_[base, close[:-1]] * (1 + rng.normal(0, 0.004, len(index)))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, len(index))))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, len(index))))
+        volume = rng.integers(100_000, 10_000_000, len(index))
+        data = pd.DataFrame({"Close": close, "High": high, "Low": low, "Open": open_, "Volume": volume}, index=index)
+        self._daily[symbol] = (today, data)
+        return data
+
+    def _intraday_bars(self, symbol, start, end, minutes):
+        """Regular-session intraday bars, each day a walk starting from that day's daily open."""
+        daily = self._daily_bars(symbol)
+        days = daily[(daily.index >= pd.Timestamp(start)) & (daily.index < pd.Timestamp(end))]
+        now = pd.Timestamp.now(tz="America/New_York")
+        frames = []
+        for day, row in days.iterrows():
+            rng = np.random.default_rng([self.seed, self._symbol_seed(symbol), day.toordinal()])
+            index = pd.date_range(day + timedelta(hours=9, minutes=30), periods=self.session_minutes,
+                                  freq="min", tz="America/New_York", name="Datetime")
+            close = row["Open"] * np.exp(np.cumsum(rng.normal(0, 0.0008, self.session_minutes)))
+            open_ = np.r_[row["Open"], close[:-1]]
+            spread = np.abs(rng.normal(0, 0.0005, self.session_minutes))
+            frame = pd.DataFrame({
+                "Close": close,
+                "High": np.maximum(open_, close) * (1 + spread),
+                "Low": np.minimum(open_, close) * (1 - spread),
+                "Open": open_,
+                "Volume": rng.integers(1_000, 100_000, self.session_minutes),
+            }, index=index)
+            frames.append(frame[frame.index <= now])
+        if not frames:
+            return pd.DataFrame(columns=["Close", "High", "Low", "Open", "Volume"])
+        data = pd.concat(frames)
+        if minutes == 1:
+            return data
+        return data.resample(f"{minutes}min", origin="start_day", offset="30min", label="left", closed="left").agg(
+            {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}).dropna(subset=["Close"])
+
+
+def make_provider(name):
+    """Build the provider selected by name ("yfinance" or "synthetic")."""
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "synthetic":
+        return SyntheticProvider(seed=SYNTHETIC_SEED, latency=SYNTHETIC_LATENCY)
+    raise ValueError(f"unknown market data provider {name!r}")
+
+
+# The process-wide provider used by helpers.lookup() and market_data; every call is timed
+provider = Instrumented(make_provider(MARKET_DATA_PROVIDER), "provider")
@@ -0,0 +1,51 @@
+import logging
+import threading
+import time
+
+from helpers import refresh_quotes
+
+log = logging.getLogger(__name__)
+
+
+class QuoteRefresher(threading.Thread):
+    """
+    Background thread that keeps the quote cache warm.
+
+    Every interval seconds it asks symbols_fn() for the symbols worth keeping
+    fresh (e.g. everything held in any portfolio) and refreshes them with one
+    batched provider call, so page loads read prices from memory instead of
+    waiting on the provider. Keep interval below QUOTE_TTL so entries never
+    expire between refreshes. The first refresh happens one interval after
+    start(), so a booting worker neither waits on the network nor imports the
+    market data stack while it is still serving its first requests.
+    """
+
+    def __init__(self, symbols_fn, interval):
+        super().__init__(name="quote-refresher", daemon=True)
+        self.symbols_fn = symbols_fn
+        self.interval = interval
+        self.runs = 0
+        self.last_refreshed = 0
+        self.last_run_at = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        delay = self.interval
+        while not self._stop_event.wait(delay):
+            started = time.monotonic()
+            try:
+                self.last_refreshed = refresh_quotes(self.symbols_fn())
+                self.runs += 1
+                self.last_run_at = time.time()
+            except Exception as e:
+                log.warning("Error refreshing quotes in the background: %s", e)
+            delay = max(0, self.interval - (time.monotonic() - started))
+
+    def stop(self):
+        """Ask the thread to exit after the current refresh."""
+        self._stop_event.set()
+
+    def stats(self):
+        """Return a snapshot of the refresher's progress."""
+        return {"interval": self.interval, "runs": self.runs, "last_refreshed": self.last_refreshed,
+                "last_run_at": self.last_run_at}
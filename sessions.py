@@ -0,0 +1,98 @@
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class SQLiteSession(CallbackDict, SessionMixin):
+    """Server-side session whose data lives in the sessions table, keyed by a random id cookie."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+        self.rotate = False
+
+    def clear(self):
+        # Issue a fresh id whenever the session is reset (login/logout) to prevent session fixation
+        super().clear()
+        self.rotate = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """
+    Store sessions in SQLite so every worker process (and restart) shares them.
+
+    Each request reads one row by primary key. A row is written only when the
+    session changed or when its sliding expiry is due for renewal (at most once
+    per refresh seconds), and expired rows are deleted in bulk every
+    cleanup_interval seconds rather than one at a time.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, db, lifetime, refresh, cleanup_interval):
+        self.db = db
+        self.lifetime = lifetime
+        self.refresh = refresh
+        self.cleanup_interval = cleanup_interval
+        self._next_cleanup = 0
+        self._cleanup_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            rows = self.db.execute("SELECT data, expires_at FROM sessions WHERE id = ?", sid)
+            if rows and rows[0]["expires_at"] > time.time():
+                return SQLiteSession(self.serializer.loads(rows[0]["data"]), sid=sid,
+                                     expires_at=rows[0]["expires_at"])
+        return SQLiteSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        self._cleanup()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.rotate and not session.new:
+            self.db.execute("DELETE FROM sessions WHERE id = ?", session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        if not session:
+            if not session.new or session.rotate:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        renew = session.expires_at is None or session.expires_at - now < self.lifetime - self.refresh
+        if not (session.new or session.modified or renew):
+            return
+
+        expires_at = now + self.lifetime
+        self.db.execute("INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?) \
+            ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                        session.sid, self.serializer.dumps(dict(session)), expires_at)
+        if session.new or session.rotate:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _cleanup(self):
+        """Delete expired sessions in one statement, at most once per cleanup_interval per process."""
+        now = time.time()
+        if now < self._next_cleanup or not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_cleanup = now + self.cleanup_interval
+            self.db.execute("DELETE FROM sessions WHERE expires_at < ?", now)
+        finally:
+            self._cleanup_lock.release()
@@ -1,13 +1,74 @@
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 import dash
 import json
-from dash import dcc ,html ,Input, Output, callback ,State
-import yfinance as yf
+from dash import dcc ,html ,Input, Output, callback ,State, Patch
+from dash.exceptions import PreventUpdate
 from datetime import datetime,timedelta,date
-from plotly.subplots import make_subplots
+from flask import session
+
+from helpers import TTLCache, may_exist, symbol_directory
+from metrics import timed
+
+# numpy, plotly and the market data modules (pandas, yfinance) are imported inside the functions that
+# need them, so importing this module and building the layout is cheap and never touches the network
+
+
+DEFAULT_TICKER = "AAPL"
+
+# Charts are drawn at a fixed width; series are reduced to about one point per pixel before plotting
+CHART_WIDTH = 1450
+# A candle needs a few pixels (body plus gap) to stay readable
+MAX_CANDLES = CHART_WIDTH // 3
+# Above this many points a line trace is rendered with WebGL (the same cut-off plotly express uses)
+WEBGL_THRESHOLD = 1000
+
+RECOMMENDATION_LABELS = {
+    '0m': 'This Month',
+    '-1m': 'Last Month',
+    '-2m': '2 Months Ago',
+    '-3m': '3 Months Ago'
+}
+RECOMMENDATION_COLUMNS = ["strongBuy", "buy", "hold", "sell", "strongSell"]
+
+# Static part of every chart: trace styling and layout. Only trace data and titles change per request.
+CHARTS = {
+    "candle": {
+        "title": "{} Candlestick Chart with SMA, EMA",
+        "traces": [dict(type="candlestick", name="candle"),
+                   dict(type="scatter", mode="lines", name="SMA 10", line=dict(color="blue", width=1)),
+                   dict(type="scatter", mode="lines", name="EMA 10", line=dict(color="pink", width=1))],
+        "layout": dict(xaxis_rangeslider_visible=False, # Often removed for intraday charts
+                       height=600, width=CHART_WIDTH,
+                       hovermode="x unified", # Shows hover data for all traces at a given x-point
+                       template="plotly_dark",
+                       legend_orientation="h", legend_y=1.02, legend_x=0.1), # Legend above the chart
+    },
+    "rsi": {
+        "title": "RSI for {}",
+        "traces": [dict(type="scatter", mode="lines", name="RSI")],
+        "layout": dict(template="plotly_dark", width=CHART_WIDTH, xaxis_title="Datetime", yaxis_title="RSI"),
+    },
+    "group_bar": {
+        "title": "bar122 for {}",
+        "traces": [dict(type="bar", name=column) for column in RECOMMENDATION_COLUMNS],
+        "layout": dict(barmode="group", height=400, width=720, xaxis_title="period", yaxis_title="value",
+                       legend_title_text="variable"),
+    },
+    "line": {
+        "title": "line for {}",
+        "traces": [dict(type="scatter", mode="lines", name="Close")],
+        "layout": dict(xaxis_title="Date", yaxis_title="Close"),
+    },
+    "equity": {
+        "title": "Portfolio value",
+        "traces": [dict(type="scatter", mode="lines", name="Total (stocks and cash)"),
+                   dict(type="scatter", mode="lines", name="Stocks", fill="tozeroy")],
+        "layout": dict(height=450, width=CHART_WIDTH, hovermode="x unified", xaxis_title="Date",
+                       yaxis_title="Value (USD)"),
+    },
+}
+_layouts = {}
+# group_bar_series() results by ticker, reused for as long as get_recommendations() returns the same data
+_group_bar_series = TTLCache(24 * 60 * 60, 256)
 
 
 # external_stylesheets = ['amazone_dash_style.css']
@@ -15,161 +76,211 @@ from plotly.subplots import make_subplots
 
 # ############################################################ PLOTS ############################################################
 
-def calculate_rsi(data, window=14):
-    """Calculates Relative Strength Index (RSI) manually."""
-    # Ensure 'Close' column is numeric
-    close_prices = data['Close'].astype("float")
+def checked_ticker(ticker):
+    """ticker upper-cased and stripped; stops the callback (PreventUpdate) unless may_exist() accepts it."""
+    symbol = (ticker or "").upper().strip()
+    if not may_exist(symbol):
+        raise PreventUpdate
+    return symbol
 
-    # Calculate price changes
-    delta = close_prices.diff()
 
-    # Calculate gains (upward changes) and losses (downward changes)
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
+def chart_layout(chart):
+    """Layout of chart with its template resolved; built once and reused for every figure."""
+    layout = _layouts.get(chart)
+    if layout is None:
+        import plotly.graph_objects as go
 
-    # Calculate average gains and losses over the window
-    avg_gain = gain.rolling(window=window, min_periods=1).mean()
-    avg_loss = loss.rolling(window=window, min_periods=1).mean()
+        layout = _layouts[chart] = go.Figure(layout=CHARTS[chart]["layout"]).to_plotly_json()["layout"]
+    return layout
 
-    # Calculate Relative Strength (RS)
-    # Handle division by zero for avg_loss
-    rs = np.where(avg_loss == 0, np.inf, avg_gain / avg_loss)
 
-    # Calculate RSI
-    rsi = 100 - (100 / (1 + rs))
+def chart_title(chart, ticker):
+    return CHARTS[chart]["title"].format(ticker.upper())
 
-    return rsi
 
+@timed("figure")
+def chart_figure(chart, series, ticker):
+    """Complete figure (as a dict) for chart: the static layout and trace styles plus series data."""
+    data = [dict(style, **trace) for style, trace in zip(CHARTS[chart]["traces"], series)]
+    return {"data": data, "layout": dict(chart_layout(chart), title={"text": chart_title(chart, ticker)})}
+
+
+def placeholder_figure(chart):
+    """Empty figure of chart's size, shown until the dashboard's initial callback replaces it."""
+    layout = CHARTS[chart]["layout"]
+    return {"data": [], "layout": {key: layout[key] for key in ("width", "height") if key in layout}}
+
+
+@timed("figure")
+def chart_patch(chart, series, ticker):
+    """Patch that replaces only the trace data and the title of a figure already on the page."""
+    patch = Patch()
+    for i, trace in enumerate(series):
+        for key, value in trace.items():
+            patch["data"][i][key] = value
+    patch["layout"]["title"]["text"] = chart_title(chart, ticker)
+    return patch
+
+
+def chart_update(graph, chart, series, ticker, on_page, rendered):
+    """
+    Update for the dcc.Graph graph: a chart_patch() if on_page (the full-figures store) says it
+    already holds a complete figure, otherwise the complete chart_figure(), recorded in rendered.
+
+    A patch applied to a placeholder would create bare, unstyled traces, so one is only sent
+    once a complete figure is known to be in the browser.
+    """
+    if (on_page or {}).get(graph):
+        return chart_patch(chart, series, ticker)
+    rendered[graph] = True
+    return chart_figure(chart, series, ticker)
+
+
+def downsample_line(data, x, y, threshold=CHART_WIDTH):
+    """Reduce data[x], data[y] to at most threshold points with LTTB."""
+    if len(data) <= threshold:
+        return data
+    import numpy as np
+    from downsample import lttb_indices
+
+    keys = data[x].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return data.iloc[lttb_indices(keys, data[y].to_numpy(dtype="float"), threshold)]
+
+
+def line_type(points):
+    """Trace type for a line with this many points."""
+    return "scattergl" if points > WEBGL_THRESHOLD else "scatter"
+
+
+def line_series(data, x, y):
+    """Trace data for one (downsampled) line."""
+    data = downsample_line(data, x, y)
+    return {"type": line_type(len(data)), "x": data[x], "y": data[y].to_numpy()}
+
+
+def calculate_rsi(data, window=14):
+    """Calculates Relative Strength Index (RSI) with Wilder smoothing."""
+    import indicators
+
+    return indicators.rsi(data['Close'].to_numpy(dtype="float"), window)
+
+
+def day_bars(ticker, date, interval):
+    from market_data import get_chart_bars
 
-def rsi(ticker="AAPL",date="2025-08-20",interval="5m"):
     start = datetime.strptime(date, "%Y-%m-%d")
     end = start + timedelta(days=1)
-    data = yf.download(ticker,start= start.strftime(format="%Y-%m-%d"),end = end.strftime(format="%Y-%m-%d") ,multi_level_index=False,interval=interval)
-    data = pd.DataFrame(data)
-    print(data.shape)
-    data.reset_index(inplace=True)
-    
+    # Shared by candle() and rsi(): the day's base series is downloaded once and resampled locally
+    return get_chart_bars(ticker, start.strftime(format="%Y-%m-%d"), end.strftime(format="%Y-%m-%d"), interval).reset_index()
+
+
+@timed("figure")
+def rsi_series(ticker="AAPL",date="2025-08-20",interval="5m"):
+    """Trace data for the RSI chart: [RSI]."""
+    data = day_bars(ticker, date, interval)
     data['RSI'] = calculate_rsi(data, window=14)
-    rsi = px.scatter(data ,x="Datetime",y= "RSI")
-    rsi.update_traces(mode='lines')
-    rsi.update_layout( template="plotly_dark",width = 1450,title_text=f'RSI for {ticker.upper()}')
-    
-    return rsi
+    return [line_series(data, "Datetime", "RSI")]
+
+
+def rsi(ticker="AAPL",date="2025-08-20",interval="5m"):
+    return chart_figure("rsi", rsi_series(ticker, date, interval), ticker)
 
 
 def calculate_sma(data, window):
-    """Calculates Simple Moving Average (SMA) manually."""
-    return data['Close'].rolling(window=window).mean()
+    """Calculates Simple Moving Average (SMA)."""
+    import indicators
+
+    return indicators.sma(data['Close'].to_numpy(dtype="float"), window)
 
 def calculate_ema(data, window):
-    """Calculates Exponential Moving Average (EMA) manually."""
-    return data['Close'].ewm(span=window, adjust=False).mean()
+    """Calculates Exponential Moving Average (EMA)."""
+    import indicators
 
+    return indicators.ema(data['Close'].to_numpy(dtype="float"), window)
 
-def candle(ticker="AAPL",date="2025-08-20",interval="5m"):
-    start = datetime.strptime(date, "%Y-%m-%d")
-    end = start + timedelta(days=1)
-    data = yf.download(ticker,start= start.strftime(format="%Y-%m-%d"),end = end.strftime(format="%Y-%m-%d") ,multi_level_index=False,interval=interval)
-    data = pd.DataFrame(data)
-    print(data.shape)
-    data.reset_index(inplace=True)
-    
+
+@timed("figure")
+def candle_series(ticker="AAPL",date="2025-08-20",interval="5m"):
+    """Trace data for the candlestick chart: [candles, SMA 10, EMA 10]."""
+    from downsample import ohlc_buckets
+
+    data = day_bars(ticker, date, interval)
+
+    # Indicators use every bar; only what is drawn is reduced
     data['SMA_10'] = calculate_sma(data, 10)
     data['EMA_10'] = calculate_ema(data, 10)
-    # sma = px.scatter(data ,x="Datetime",y= "SMA_3",title="SMA")
-    # sma.update_traces(mode='lines')
+    x, open_, high, low, close = ohlc_buckets(data.Datetime, data.Open.to_numpy(), data.High.to_numpy(),
+                                              data.Low.to_numpy(), data.Close.to_numpy(), MAX_CANDLES)
+    candles = {"x": x, "open": open_, "high": high, "low": low, "close": close}
 
-    fig = make_subplots(
-    rows=1, cols=1
-    )
-    
-    fig.add_trace(
-        go.Candlestick(
-            x = data.Datetime,
-            open = data.Open,
-            high = data.High,
-            low = data.Low,
-            close = data.Close,
-            name='candle',
-        ),
-        row=1, col=1 # Add to the first row, first column
-    )
-    
-    fig.add_trace(
-        go.Scatter(
-            x=data["Datetime"],
-            y=data['SMA_10'],
-            mode='lines',
-            name='SMA 10',
-            line=dict(color='blue', width=1)
-        ),
-        row=1, col=1
-    )
+    return [candles, line_series(data, "Datetime", "SMA_10"), line_series(data, "Datetime", "EMA_10")]
 
-    fig.add_trace(
-        go.Scatter(
-            x=data["Datetime"],
-            y=data['EMA_10'],
-            mode='lines',
-            name='EMA 10',
-            line=dict(color='pink', width=1)
-        ),
-        row=1, col=1
-    )
-    
-    fig.update_layout(
-    title_text=f'{ticker.upper()} Candlestick Chart with SMA, EMA',
-    xaxis_rangeslider_visible=False, # Often removed for intraday charts
-    height=600, # Total height of the figure
-    width = 1450,
-    hovermode="x unified", # Shows hover data for all traces at a given x-point
-    # Optionally, set the theme
-    template="plotly_dark",
-    legend_orientation="h",
-    legend_y=1.02, # Position legend above the chart
-    legend_x=0.1
-    )
 
-    # rsi = rsi(ticker,date,interval)
-    print(ticker)
-    print("sssssssssssssssssssssssssssssssssssssssssssssssssssssssssssssssss")
-    return fig
+def candle(ticker="AAPL",date="2025-08-20",interval="5m"):
+    return chart_figure("candle", candle_series(ticker, date, interval), ticker)
+
+
+@timed("figure")
+def group_bar_series(ticker="AAPL"):
+    """Trace data for the recommendations chart: one bar group per recommendation column."""
+    import numpy as np
+    from market_data import get_recommendations
+
+    symbol = ticker.upper().strip()
+    data = get_recommendations(symbol)
+    memo = _group_bar_series.get(symbol)
+    if memo is not None and memo[0] is data:
+        return memo[1]
+    if data is None or "period" not in data:
+        # No recommendations for ticker: empty bar groups, so the other charts of the callback still update
+        return [{"x": np.array([]), "y": np.array([])} for _ in RECOMMENDATION_COLUMNS]
+
+    periods = data['period'].map(RECOMMENDATION_LABELS).to_numpy()
+    series = [{"x": periods, "y": data[column].to_numpy() if column in data else np.zeros(len(data))}
+              for column in RECOMMENDATION_COLUMNS]
+    _group_bar_series.set(symbol, (data, series))
+    return series
+
 
 def group_bar(ticker="AAPL"):
-    data = yf.Ticker(ticker)
-    data = data.recommendations
-    label_mapping = {
-    '0m': 'This Month',
-    '-1m': 'Last Month',
-    '-2m': '2 Months Ago',
-    '-3m': '3 Months Ago'
-    }
-    data['period'] = data['period'].map(label_mapping)
-    temp = pd.melt(data, id_vars=['period'])
+    return chart_figure("group_bar", group_bar_series(ticker), ticker)
 
-    bar = px.histogram(temp, x="period", y="value",
-             color='variable', barmode='group',
-             height=400,width = 720,title=f'bar122 for {ticker.upper()}')
-    return bar
 
-def line(ticker="AAPL",start="2020-01-01",end="2025-01-01",interval="1mo"):
+@timed("figure")
+def line_chart_series(ticker="AAPL",start="2020-01-01",end="2025-01-01",interval="1mo"):
+    """Trace data for the long-range line chart: [Close]."""
+    from market_data import get_chart_bars
+
     start = datetime.strptime(start, "%Y-%m-%d")
     end = datetime.strptime(end, "%Y-%m-%d")
-    data = yf.download(ticker,start= start.strftime(format="%Y-%m-%d"), end = end.strftime(format="%Y-%m-%d"),multi_level_index=False,interval=interval)
-    data.reset_index(inplace=True)
-    print(data.shape)
-    line_chart = px.line(data , x = "Date" , y = "Close",title=f'line for {ticker.upper()}')
-    return line_chart
+    data = get_chart_bars(ticker, start.strftime(format="%Y-%m-%d"), end.strftime(format="%Y-%m-%d"), interval).reset_index()
+    return [line_series(data, "Date", "Close")]
+
+
+def line(ticker="AAPL",start="2020-01-01",end="2025-01-01",interval="1mo"):
+    return chart_figure("line", line_chart_series(ticker, start, end, interval), ticker)
+
+
+@timed("figure")
+def equity_series(curve):
+    """Trace data for the portfolio value chart from an equity curve (see equity.equity_curve)."""
+    data = curve.reset_index()
+    return [line_series(data, "Date", "total"), line_series(data, "Date", "holdings")]
 
 # ############################################################ WIDGETS ############################################################
 
 ticker_input = dcc.Input(
     id="ticker-input",
     type="text", 
-    placeholder="AAPL",
-    value="AAPL"
+    placeholder=DEFAULT_TICKER,
+    value=DEFAULT_TICKER,
+    list="ticker-options",
+    autoComplete="off"
 )
 
+# Suggestions for ticker_input, filled from the local symbol directory as the user types
+ticker_options = html.Datalist(id="ticker-options")
+
 
 today_date = datetime.now().date()
 
@@ -201,7 +312,7 @@ single_date = dcc.DatePickerSingle(
 # dcc.Dropdown was already correct
 dropdown_choice = dcc.Dropdown(
     options=[{"label": "Monthly", "value": "1mo"}, {"label": "3 Monthly", "value": "3mo"}], 
-    value="Monthly",
+    value="1mo",
     id="line_choice",
     style={"width":"100%"}
 )
@@ -228,6 +339,13 @@ submit_ticker_button = html.Button(
     style={'marginLeft': '10px', 'padding': '8px 15px', 'backgroundColor': '#007bff', 'color': 'white', 'border': 'none', 'borderRadius': '5px', 'cursor': 'pointer'}
 )
 
+submit_portfolio_button = html.Button(
+    'Update Portfolio Value',
+    id='submit-portfolio-button',
+    n_clicks=0,
+    style={'marginLeft': '10px', 'padding': '8px 15px', 'backgroundColor': '#17a2b8', 'color': 'white', 'border': 'none', 'borderRadius': '5px', 'cursor': 'pointer'}
+)
+
 submit_line_button = html.Button(
     'Update Line Plot',
     id='submit-line-button',
@@ -238,7 +356,13 @@ submit_line_button = html.Button(
 
 # ############################################################ LAYOUT ############################################################
 
-def init_dash_app(flask_app):
+def init_dash_app(flask_app, portfolio_value=None):
+    """
+    Mount the dashboard on flask_app at /dashboard/.
+
+    portfolio_value(user_id) returns the logged-in user's equity curve for the portfolio value
+    chart; without it the chart stays empty.
+    """
     dash_app = dash.Dash(__name__, server=flask_app, url_base_pathname='/dashboard/')
 
 
@@ -248,6 +372,7 @@ def init_dash_app(flask_app):
                         html.Div([
                         html.Label("Ticker Symbol:", style={'marginRight': '5px', 'fontWeight': 'bold'}),
                         ticker_input,
+                        ticker_options,
                         submit_ticker_button,
                         html.Div(
                             "For better results, try adding an exchange suffix, e.g., 'TATAMOTORS.NS' or 'D05.SI'.",
@@ -282,14 +407,14 @@ def init_dash_app(flask_app):
                         html.Div([
 
                             html.Div([
-                            html.Div(dcc.Graph(figure=candle(),id="candle")),
+                            html.Div(dcc.Graph(figure=placeholder_figure("candle"),id="candle")),
                                 ],
                                 style={"display": "flex","gap": "15px","width":"100px"}
                                 ),
 
                             html.Br(),
                             html.Div([
-                            html.Div(dcc.Graph(figure=rsi(),id="rsi")),
+                            html.Div(dcc.Graph(figure=placeholder_figure("rsi"),id="rsi")),
                             ],
                             style={"display": "flex", "gap": "15px","width":"100px"}
                             ),
@@ -299,11 +424,11 @@ def init_dash_app(flask_app):
                         #     html.Div(dcc.Graph(figure=tree()),id="tree"),
 
                             html.Div([
-                                html.Div(dcc.Graph(figure=group_bar(),id="bar1"),
+                                html.Div(dcc.Graph(figure=placeholder_figure("group_bar"),id="bar1"),
                                 id="state"
                                 ),
 
-                                html.Div(dcc.Graph(figure=group_bar(),id="bar2"),
+                                html.Div(dcc.Graph(figure=placeholder_figure("group_bar"),id="bar2"),
                                 id="month"
                                 ),],
 
@@ -332,7 +457,18 @@ def init_dash_app(flask_app):
                             ], style={"display": "flex", "gap": "15px", "alignItems": "center", "flexWrap": "wrap"}), # Align items and allow wrap
 
                             html.Div([
-                            html.Div(dcc.Graph(figure=line(),id="line")),
+                            html.Div(dcc.Graph(figure=placeholder_figure("line"),id="line")),
+                                ],),
+
+                            html.Br(),
+
+                            html.Div(submit_portfolio_button),
+
+                            # Graphs that hold a complete figure (and can take patches) on this page
+                            dcc.Store(id="full-figures", data={}),
+
+                            html.Div([
+                            html.Div(dcc.Graph(figure=placeholder_figure("equity"),id="equity")),
                                 ],),
 
                             
@@ -355,6 +491,15 @@ def init_dash_app(flask_app):
     #     return candle(ticker),rsi(ticker)
 
 
+    @callback(
+        Output('ticker-options', 'children'),
+        Input('ticker-input', 'value'),
+    )
+    @timed("callback")
+    def suggest_tickers(ticker_val):
+        return [html.Option(match["name"], value=match["symbol"]) for match in symbol_directory.search(ticker_val or "")]
+
+
     # dashboard
     @callback(
         Output('candle', 'figure',allow_duplicate=True),
@@ -362,59 +507,92 @@ def init_dash_app(flask_app):
         Output('bar1', 'figure'),
         Output('bar2', 'figure'),
         Output('line', 'figure'),
+        Output('full-figures', 'data', allow_duplicate=True),
         Input('submit-ticker-button', 'n_clicks'),
         State('ticker-input', 'value'),
-        prevent_initial_call=True
+        State('full-figures', 'data'),
+        # Also runs on page load to fill in the placeholder charts
+        prevent_initial_call='initial_duplicate'
     )
-    def update_on_ticker_submit(n_clicks, ticker_val):
-        if n_clicks is None or n_clicks == 0:
-            return None
+    @timed("callback")
+    def update_on_ticker_submit(n_clicks, ticker_val, on_page):
+        ticker_val = checked_ticker(ticker_val or DEFAULT_TICKER)
+        # The placeholders are replaced by complete figures; after that only trace data and titles
+        # are sent, and the figures' layouts stay as they are in the browser
+        rendered = Patch()
+        group_bar = group_bar_series(ticker_val)
 
-        candle_chart = candle(ticker_val)
-        rsi_chart = rsi(ticker_val)
-        group_bar_chart = group_bar(ticker_val)
-        line_chart = line(ticker_val)
+        candle_chart = chart_update("candle", "candle", candle_series(ticker_val), ticker_val, on_page, rendered)
+        rsi_chart = chart_update("rsi", "rsi", rsi_series(ticker_val), ticker_val, on_page, rendered)
+        bar1_chart = chart_update("bar1", "group_bar", group_bar, ticker_val, on_page, rendered)
+        bar2_chart = chart_update("bar2", "group_bar", group_bar, ticker_val, on_page, rendered)
+        line_chart = chart_update("line", "line", line_chart_series(ticker_val), ticker_val, on_page, rendered)
 
-        return candle_chart, rsi_chart, group_bar_chart, group_bar_chart, line_chart
+        return candle_chart, rsi_chart, bar1_chart, bar2_chart, line_chart, rendered
 
 
     @callback(
         Output('candle', 'figure',allow_duplicate=True),
         Output('rsi', 'figure',allow_duplicate=True),
+        Output('full-figures', 'data', allow_duplicate=True),
         Input('submit-candle-button', 'n_clicks'),
         State('ticker-input', 'value'),
         State('single_date_picker', 'date'),
         State('interval', 'value'),
+        State('full-figures', 'data'),
         prevent_initial_call=True
     )
-    def update_on_candle_submit(n_clicks, ticker_val,single_date,candle_interval):
+    @timed("callback")
+    def update_on_candle_submit(n_clicks, ticker_val,single_date,candle_interval,on_page):
         if n_clicks is None or n_clicks == 0:
-            return None
-        candle_chart = candle(ticker_val,single_date,candle_interval)
-        rsi_chart = rsi(ticker_val,single_date,candle_interval)
+            raise PreventUpdate
+        ticker_val = checked_ticker(ticker_val)
+        rendered = Patch()
+        candle_chart = chart_update("candle", "candle", candle_series(ticker_val,single_date,candle_interval),
+                                    ticker_val, on_page, rendered)
+        rsi_chart = chart_update("rsi", "rsi", rsi_series(ticker_val,single_date,candle_interval), ticker_val,
+                                 on_page, rendered)
 
 
-        return candle_chart, rsi_chart
+        return candle_chart, rsi_chart, rendered
 
     @callback(
         Output('line', 'figure',allow_duplicate=True),
+        Output('full-figures', 'data', allow_duplicate=True),
         Input('submit-line-button', 'n_clicks'),
         State('ticker-input', 'value'),
         State('date_range', 'start_date'),
         State('date_range', 'end_date'),
         State('line_choice', 'value'),
+        State('full-figures', 'data'),
         prevent_initial_call=True
     )
-    def update_on_line_submit(n_clicks, ticker_val,start_date,end_date,line_choice):
+    @timed("callback")
+    def update_on_line_submit(n_clicks, ticker_val,start_date,end_date,line_choice,on_page):
         if n_clicks is None or n_clicks == 0:
-            return None
-        print(ticker_val)
-        print(start_date)
-        print(end_date)
-        print(line_choice)
-        line_chart = line(ticker_val,start_date,end_date,line_choice)
-
-        return line_chart
+            raise PreventUpdate
+        ticker_val = checked_ticker(ticker_val)
+        rendered = Patch()
+        line_chart = chart_update("line", "line", line_chart_series(ticker_val,start_date,end_date,line_choice),
+                                  ticker_val, on_page, rendered)
+
+        return line_chart, rendered
+
+    @callback(
+        Output('equity', 'figure'),
+        Output('full-figures', 'data', allow_duplicate=True),
+        Input('submit-portfolio-button', 'n_clicks'),
+        State('full-figures', 'data'),
+        # Also runs on page load to fill in the placeholder chart
+        prevent_initial_call='initial_duplicate'
+    )
+    @timed("callback")
+    def update_on_portfolio_submit(n_clicks, on_page):
+        user_id = session.get("user_id")
+        if portfolio_value is None or user_id is None:
+            raise PreventUpdate
+        rendered = Patch()
+        return chart_update("equity", "equity", equity_series(portfolio_value(user_id)), "", on_page, rendered), rendered
 
     return dash_app
         
@@ -0,0 +1,180 @@
+import bisect
+import csv
+import os
+import re
+import threading
+import uuid
+
+
+# What a Yahoo ticker can look like: letters, digits and . - ^ = (e.g. BRK-B, TATAMOTORS.NS, ^GSPC, EURUSD=X)
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9^][A-Z0-9.\-^=]{0,19}$")
+
+FIELDS = ("symbol", "name", "suffix")
+
+# Timezone of the exchange behind each Yahoo suffix; symbols without a known suffix trade in New York
+EXCHANGE_TIMEZONES = {
+    "": "America/New_York", "TO": "America/Toronto", "V": "America/Toronto", "SA": "America/Sao_Paulo",
+    "MX": "America/Mexico_City", "L": "Europe/London", "IR": "Europe/Dublin", "PA": "Europe/Paris",
+    "AS": "Europe/Amsterdam", "BR": "Europe/Brussels", "DE": "Europe/Berlin", "F": "Europe/Berlin",
+    "MI": "Europe/Rome", "MC": "Europe/Madrid", "SW": "Europe/Zurich", "ST": "Europe/Stockholm",
+    "OL": "Europe/Oslo", "CO": "Europe/Copenhagen", "HE": "Europe/Helsinki", "NS": "Asia/Kolkata",
+    "BO": "Asia/Kolkata", "SI": "Asia/Singapore", "HK": "Asia/Hong_Kong", "SS": "Asia/Shanghai",
+    "SZ": "Asia/Shanghai", "T": "Asia/Tokyo", "KS": "Asia/Seoul", "KQ": "Asia/Seoul", "TW": "Asia/Taipei",
+    "AX": "Australia/Sydney", "NZ": "Pacific/Auckland", "JO": "Africa/Johannesburg",
+}
+
+
+def exchange_suffix(symbol):
+    """Exchange suffix of a Yahoo symbol ('NS' for 'TATAMOTORS.NS'); empty for US listings."""
+    base, dot, suffix = symbol.rpartition(".")
+    return suffix if dot and base else ""
+
+
+def exchange_timezone(symbol):
+    """Timezone name of the exchange symbol trades on, from its suffix (America/New_York if unknown)."""
+    return EXCHANGE_TIMEZONES.get(exchange_suffix(symbol), EXCHANGE_TIMEZONES[""])
+
+
+class SymbolDirectory:
+    """
+    Locally stored directory of known symbols (symbol, company name, exchange suffix).
+
+    Entries live in a CSV file and are loaded on first use into two sorted
+    indexes, one over symbols and one over the words of company names, so a
+    prefix query is a pair of binary searches instead of a scan or a network
+    call. Symbols the provider has confirmed are added with add(); bulk listings
+    (e.g. the NASDAQ Trader symbol files) can be merged in with import_file().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._symbols = []
+        self._words = []
+
+    def __contains__(self, symbol):
+        return symbol in self._load()
+
+    def __len__(self):
+        return len(self._load())
+
+    def search(self, query, limit=10):
+        """
+        Entries whose symbol, or any word of whose name, starts with query (case-insensitive).
+
+        Symbol matches come first, shortest symbol first; up to limit entries are returned.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        entries = self._load()
+        found = []
+
+        prefix = query.upper()
+        start = bisect.bisect_left(self._symbols, prefix)
+        stop = bisect.bisect_left(self._symbols, prefix + "\uffff")
+        found.extend(sorted(self._symbols[start:stop], key=lambda symbol: (len(symbol), symbol)))
+
+        if len(found) < limit:
+            prefix = query.lower()
+            start = bisect.bisect_left(self._words, (prefix,))
+            stop = bisect.bisect_left(self._words, (prefix + "\uffff",))
+            seen = set(found)
+            for _, symbol in self._words[start:stop]:
+                if symbol not in seen:
+                    seen.add(symbol)
+                    found.append(symbol)
+
+        return [{"symbol": symbol, "name": entries[symbol][0], "suffix": entries[symbol][1]}
+                for symbol in found[:limit]]
+
+    def add(self, symbol, name):
+        """Remember a symbol the provider has confirmed; appends it to the file if it is new."""
+        entries = self._load()
+        if symbol in entries:
+            return False
+        with self._lock:
+            if symbol in entries:
+                return False
+            self._insert(symbol, name or symbol)
+            new_file = not os.path.exists(self.path)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(FIELDS)
+                writer.writerow((symbol, name or symbol, exchange_suffix(symbol)))
+        return True
+
+    def import_file(self, path):
+        """
+        Merge a listing file into the directory and rewrite it; returns the number of new symbols.
+
+        Accepts a CSV with symbol and name columns, or the pipe-delimited NASDAQ Trader
+        files (nasdaqlisted.txt / otherlisted.txt, whose columns are "Symbol" or
+        "ACT Symbol" and "Security Name").
+        """
+        with open(path, newline="") as f:
+            sample = f.readline()
+            f.seek(0)
+            reader = csv.DictReader(f, delimiter="|" if "|" in sample else ",")
+            rows = []
+            for row in reader:
+                row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+                symbol = (row.get("symbol") or row.get("act symbol") or "").upper()
+                # NASDAQ Trader files end with a "File Creation Time" line and flag test issues
+                if not SYMBOL_PATTERN.match(symbol) or row.get("test issue") == "Y":
+                    continue
+                rows.append((symbol, row.get("name") or row.get("security name") or symbol))
+
+        entries = self._load()
+        with self._lock:
+            added = 0
+            for symbol, name in rows:
+                if symbol not in entries:
+                    entries[symbol] = (name, exchange_suffix(symbol))
+                    added += 1
+            self._symbols, self._words = _build_indexes(entries)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(FIELDS)
+                for symbol in self._symbols:
+                    writer.writerow((symbol, entries[symbol][0], entries[symbol][1]))
+            os.replace(tmp_path, self.path)
+        return added
+
+    def _load(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    entries = {}
+                    try:
+                        with open(self.path, newline="") as f:
+                            for row in csv.DictReader(f):
+                                entries[row["symbol"]] = (row["name"], row["suffix"])
+                    except FileNotFoundError:
+                        pass
+                    self._symbols, self._words = _build_indexes(entries)
+                    self._entries = entries
+        return self._entries
+
+    def _insert(self, symbol, name):
+        """Add an entry to the indexes; the caller holds the lock."""
+        self._entries[symbol] = (name, exchange_suffix(symbol))
+        bisect.insort(self._symbols, symbol)
+        for word in _name_words(name):
+            bisect.insort(self._words, (word, symbol))
+
+
+def _build_indexes(entries):
+    """Sorted symbols and sorted (name word, symbol) pairs for entries."""
+    return sorted(entries), sorted((word, symbol) for symbol, (name, _) in entries.items()
+                                   for word in _name_words(name))
+
+
+def _name_words(name):
+    """Distinct lower-case words of a company name, as indexed for prefix search."""
+    return set(re.findall(r"[a-z0-9&']+", name.lower()))